@@ -0,0 +1,127 @@
+import lzma
+import os
+import struct
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Per-block codecs ---
+# The codec byte of a block table entry says how the block is stored. Any
+# codec other than CODEC_RAW splits the block into CODEC_CHUNK_BYTES chunks
+# that are compressed independently (on a thread pool: zlib, lzma and zstd
+# all release the GIL):
+#   raw size ('>Q'), chunk size ('>I')
+#   end offset of every compressed chunk, relative to the first one ('>u8' each)
+#   compressed chunks
+# so a reader can decompress just the chunks covering the bytes it needs.
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+CODEC_ZSTD = 3
+
+CODEC_CHUNK_BYTES = 1 << 20
+CHUNKED_HEADER = struct.Struct('>QI')
+CHUNK_OFFSET = struct.Struct('>Q')
+
+# codec id → (name, compress(bytes), decompress(bytes))
+CODECS = {}
+
+def register_codec(codec, name, compress, decompress):
+    if codec == CODEC_RAW or not 0 < codec < 256:
+        raise ValueError(f"codec id {codec} is reserved or out of range")
+    CODECS[codec] = (name, compress, decompress)
+
+register_codec(CODEC_ZLIB, 'zlib', lambda data: zlib.compress(data, 6), zlib.decompress)
+register_codec(CODEC_LZMA, 'lzma', lzma.compress, lzma.decompress)
+
+# zstd needs the optional 'zstandard' package
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+else:
+    register_codec(CODEC_ZSTD, 'zstd', lambda data: zstandard.ZstdCompressor(level=9).compress(data),
+                   lambda data: zstandard.ZstdDecompressor().decompress(data))
+
+# Codec id or name ('zlib', 'lzma', 'zstd', 'raw') → codec id
+def codec_id(codec):
+    if codec is None or codec == 'raw' or codec == CODEC_RAW:
+        return CODEC_RAW
+    for known, (name, _, _) in CODECS.items():
+        if codec in (known, name):
+            return known
+    if codec in ('zstd', CODEC_ZSTD):
+        raise ImportError("the zstd codec needs the 'zstandard' package")
+    raise ValueError(f"unknown block codec {codec!r}")
+
+def _codec(codec):
+    if codec not in CODECS:
+        raise ValueError(f"block uses codec {codec}, which is not available")
+    return CODECS[codec]
+
+def _map(fn, items, workers):
+    if workers == 1 or len(items) < 2:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(workers or os.cpu_count()) as pool:
+        return list(pool.map(fn, items))
+
+# Raw block bytes → stored bytes for codec
+def compress_block(data, codec, chunk_size=CODEC_CHUNK_BYTES, workers=None):
+    if codec == CODEC_RAW:
+        return data
+    _, compress, _ = _codec(codec)
+    data = memoryview(data).cast('B')
+    chunks = _map(lambda start: compress(data[start:start + chunk_size]), range(0, len(data), chunk_size), workers)
+    parts = [CHUNKED_HEADER.pack(len(data), chunk_size)]
+    end = 0
+    for chunk in chunks:
+        end += len(chunk)
+        parts.append(CHUNK_OFFSET.pack(end))
+    return b''.join(parts + chunks)
+
+
+# Random-access view of a chunked block: read(start, end) only decompresses
+# the chunks covering [start, end) and keeps the last few around, so a
+# sequential scan decompresses every chunk once.
+class CompressedBlock:
+    def __init__(self, stored, codec, cached_chunks=4):
+        self.stored = stored
+        self.codec = codec
+        self.decompress = _codec(codec)[2]
+        self.size, self.chunk_size = CHUNKED_HEADER.unpack_from(stored, 0)
+        n_chunks = (self.size + self.chunk_size - 1) // self.chunk_size
+        first = CHUNKED_HEADER.size + n_chunks * CHUNK_OFFSET.size
+        ends = [CHUNK_OFFSET.unpack_from(stored, CHUNKED_HEADER.size + k * CHUNK_OFFSET.size)[0]
+                for k in range(n_chunks)]
+        self.bounds = [(first + start, first + end) for start, end in zip([0] + ends[:-1], ends)]
+        self.cache = OrderedDict()
+        self.cached_chunks = cached_chunks
+
+    def __len__(self):
+        return self.size
+
+    def chunk(self, k):
+        if k in self.cache:
+            self.cache.move_to_end(k)
+            return self.cache[k]
+        start, end = self.bounds[k]
+        data = self.decompress(self.stored[start:end])
+        self.cache[k] = data
+        if len(self.cache) > self.cached_chunks:
+            self.cache.popitem(last=False)
+        return data
+
+    # Raw bytes [start, end)
+    def read(self, start, end):
+        end = min(end, self.size)
+        if start >= end:
+            return b''
+        first = start // self.chunk_size
+        last = (end - 1) // self.chunk_size
+        data = b''.join(self.chunk(k) for k in range(first, last + 1))
+        skip = start - first * self.chunk_size
+        return data[skip:skip + end - start]
+
+    # The whole raw block, chunks decompressed in parallel
+    def tobytes(self, workers=None):
+        return b''.join(_map(lambda bounds: self.decompress(self.stored[bounds[0]:bounds[1]]), self.bounds, workers))
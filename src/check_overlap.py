@@ -1,33 +1,21 @@
-import os
+import numpy as np
+from hex_container import HexContainer
+from variant_records import TYPE_NAMES, VARIANT_SNP
+
 def check_duplicate_indels(hex_path):
     seen = set()
     duplicates = []
 
-    with open(hex_path, 'rb') as f:
-        f.seek(0, os.SEEK_END)
-        f.seek(max(0, f.tell() - 20000), os.SEEK_SET)
-        data = f.read()
-
-    i = 0
-    while i < len(data):
-        t = data[i]
-        pos = int.from_bytes(data[i+1:i+5], 'big')
-        length = data[i+5]
-
-        if t == 0x00:
-            key = ('del', pos, length)
-            i += 6
-        elif t == 0x01:
-            encoded = data[i+6:i+22]
-            key = ('ins', pos, length, encoded)
-            i += 22
-        else:
-            break
+    with HexContainer(hex_path) as hexfile:
+        for contig in range(len(hexfile.contigs)):
+            variants = hexfile.variant_table(contig, strict=False)
+            for i in np.flatnonzero(variants.vtype != VARIANT_SNP):
+                key = (TYPE_NAMES[variants.vtype[i]], int(variants.pos[i]), int(variants.length[i]), variants.bases(i))
 
-        if key in seen:
-            duplicates.append(key)
-        else:
-            seen.add(key)
+                if key in seen:
+                    duplicates.append(key)
+                else:
+                    seen.add(key)
 
     if duplicates:
         print(" Identified overlapping ins/del:")
@@ -37,4 +25,4 @@ def check_duplicate_indels(hex_path):
         print(" No identified overlaaping ins/del.")
 
 
-check_duplicate_indels("/Users/jayjung/Comp571/final project/chr11_combined_binary.hex")
\ No newline at end of file
+check_duplicate_indels("/Users/jayjung/Comp571/final project/chr11_combined_binary.hex")
@@ -1,118 +1,56 @@
 import os
-import struct
-
-def encode_base2bit(base):
-    return {'A': 0b00, 'C': 0b01, 'G': 0b10, 'T': 0b11}.get(base, 0b00)
-
-def encode_seq_variable(seq):
-    bits = 0
-    for base in seq:
-        bits <<= 2
-        bits |= encode_base2bit(base)
-    byte_len = (len(seq) * 2 + 7) // 8
-    return bits.to_bytes(byte_len, 'big')
+from vcf_reader import vcf_batches, VT_SNP, VT_INDEL
+from variant_records import VariantTable
 
 # Step 1: extract every variants from vcf
 def extract_vt_variants(vcf_path):
     variants = []
     base_dir = os.path.dirname(os.path.abspath(__file__))
-    full_vcf_path = os.path.join(base_dir, vcf_path)
-
-    with open(full_vcf_path, 'r') as f:
-        for line in f:
-            if line.startswith('#'):
-                continue
-
-            fields = line.strip().split('\t')
-            if len(fields) < 8:
-                continue
-
-            pos = int(fields[1])
-            ref = fields[3]
-            alt_field = fields[4]
-            info = fields[7]
+    # an already parsed VcfBatch can be passed instead of a path
+    full_vcf_path = os.path.join(base_dir, vcf_path) if isinstance(vcf_path, str) else vcf_path
 
-            if 'VT=SNP' in info:
+    for batch in vcf_batches(full_vcf_path):
+        for pos, vt, ref, alt_field in zip(batch.pos.tolist(), batch.vt.tolist(), batch.ref, batch.alt):
+            if vt == VT_SNP:
                 for alt in alt_field.split(','):
                     variants.append((pos, ('SNP', ref, alt)))
-            elif 'VT=INDEL' in info:
+            elif vt == VT_INDEL:
                 for alt in alt_field.split(','):
                     variants.append((pos, ('INDEL', ref, alt)))
     return variants
 
-# Step 2: convert to binary record
+# Step 2: convert to VariantTable of binary records
 def convert_variants_to_binary_records(vt_variants):
-    binary_records = []
+    records = []
     for pos, (vt_type, ref, alt) in vt_variants:
         if vt_type == 'SNP' and len(ref) == 1 and len(alt) == 1:
-            record = (
-                b'\x00' +
-                struct.pack('>I', pos) +
-                bytes([encode_base2bit(ref)]) +
-                bytes([encode_base2bit(alt)])
-            )
-            binary_records.append((pos, record))
+            records.append({'type': 'snp', 'pos': pos, 'ref': ref, 'alt': alt})
 
         elif vt_type == 'INDEL':
             if len(ref) > len(alt) and ref.startswith(alt):  # Deletion
                 del_seq = ref[len(alt):]
-                if len(del_seq) == 0:
-                    continue
-                encoded = encode_seq_variable(del_seq)
-                record = (
-                    b'\x02' +
-                    struct.pack('>I', pos) +
-                    struct.pack('>H', len(del_seq)) +
-                    encoded
-                )
-                binary_records.append((pos, record))
+                records.append({'type': 'del', 'pos': pos, 'len': len(del_seq), 'seq': del_seq})
 
             elif len(ref) < len(alt) and alt.startswith(ref):  # Insertion
-                ins_seq = alt[len(ref):]
-                if len(ins_seq) == 0:
-                    continue
-                encoded = encode_seq_variable(ins_seq)
-                record = (
-                    b'\x01' +
-                    struct.pack('>I', pos) +
-                    struct.pack('>H', len(ins_seq)) +
-                    encoded
-                )
-                binary_records.append((pos, record))
+                records.append({'type': 'ins', 'pos': pos, 'alt': alt[len(ref):]})
 
+    binary_records = VariantTable.from_records(records)
     print(" Muatation from first 15 binary record (hex):")
-    for _, rec in binary_records[:15]:
-        print(rec.hex())
+    for i in range(min(15, len(binary_records))):
+        print(binary_records.record_bytes(i).hex())
 
     return binary_records
 
 # Step 3: save as binary 
 def write_binary_records(output_path, binary_records):
     with open(output_path, 'wb') as f:
-        for _, record in binary_records:
-            f.write(record)
+        f.write(binary_records.to_block())
     print(f" saved as binary file: {output_path}")
 
 # Step 4: Extract POS from binary file
 def extract_positions_from_bin(bin_path):
-    positions = set()
     with open(bin_path, 'rb') as f:
-        while True:
-            header = f.read(1)
-            if not header:
-                break
-            variant_type = header[0]
-            pos = struct.unpack('>I', f.read(4))[0]
-            positions.add(pos)
-            if variant_type == 0x00:
-                f.read(2)  # REF+ALT
-            elif variant_type in (0x01, 0x02):  # INS or DEL
-                length = struct.unpack('>H', f.read(2))[0]
-                byte_len = (length * 2 + 7) // 8
-                f.read(byte_len)
-            else:
-                break
-    return positions
+        return set(VariantTable.from_block(f.read(), strict=False).pos.tolist())
 
 
 if __name__ == '__main__':
@@ -1,20 +1,54 @@
 import os
+from functools import partial
+from hex_container import (HexContainer, write_hex_file, META_MARKER, BLOCK_REFERENCE, BLOCK_MASK,
+                           BLOCK_MASK_RUNS, BLOCK_VARIANTS, BLOCK_VARIANT_COLUMNS, BLOCK_META, BLOCK_VARIANT_INDEX)
+from variant_records import build_variant_index, VariantTable, VariantColumns
 
-def combine_blocks(reference_path, variant_path, output_path):
-    with open(reference_path, 'rb') as ref_file:
-        ref_data = ref_file.read()
+# variant_path holds variant records, optionally followed by the
+# 'META' + u32 length + metadata section appended by meatadata_to_hex
+def split_variant_file(var_data):
+    meta_idx = var_data.rfind(META_MARKER)
+    if meta_idx == -1:
+        return var_data, b''
+    meta_len = int.from_bytes(var_data[meta_idx + 4:meta_idx + 8], 'big')
+    return var_data[:meta_idx], var_data[meta_idx + 8:meta_idx + 8 + meta_len]
 
+# columns=True stores the variants split by type (VCOL) instead of as one
+# record stream (VARS + VIDX). reference_snps=True (implies columns) also
+# leaves SNP REF bases out, since they can be read from the reference;
+# verify_ref checks them against it first (ValueError on a mismatch).
+def combine_blocks(reference_path, variant_path, output_path, columns=False, reference_snps=False,
+                   verify_ref=True):
     with open(variant_path, 'rb') as var_file:
         var_data = var_file.read()
+    variants, meta = split_variant_file(var_data)
 
-    with open(output_path, 'wb') as out_file:
-        out_file.write(ref_data)     #  Reference + Mask
-        out_file.write(var_data)     #  Variants + Metadata
+    # variants_extracted.bin has no CHROM column, so it belongs to the first contig
+    with HexContainer(reference_path) as reference:
+        columns = columns or reference_snps
+        if columns:
+            snp_reference = partial(reference.reference_codes, 0) if reference_snps else None
+            table = VariantTable.from_block(variants)
+            blocks = [(BLOCK_VARIANT_COLUMNS, 0, VariantColumns.encode(table, snp_reference, verify_ref))]
+        else:
+            blocks = [(BLOCK_VARIANTS, 0, variants)]  #  Variants + Metadata
+        blocks.append((BLOCK_META, 0, meta))
+        index = build_variant_index(variants) if not columns else b''
+        if index:
+            blocks.append((BLOCK_VARIANT_INDEX, 0, index))
+
+        ref_blocks = []
+        for contig in range(len(reference.contigs)):
+            for kind in (BLOCK_REFERENCE, BLOCK_MASK, BLOCK_MASK_RUNS):  #  Reference + Mask
+                if reference.block(kind, contig) is not None:
+                    ref_blocks.append((kind, contig, reference.block(kind, contig)))
+        ref_size = sum(len(data) for _, _, data in ref_blocks)
+        total = write_hex_file(output_path, reference.contigs, ref_blocks + blocks)
 
     print(f" Done creating final BIN file → {output_path}")
-    print(f"Reference+Mask Size: {len(ref_data)} bytes")
+    print(f"Reference+Mask Size: {ref_size} bytes")
     print(f" Variant+Meta size: {len(var_data)} bytes")
-    print(f" Size of the whole file: {len(ref_data) + len(var_data)} bytes")
+    print(f" Size of the whole file: {total} bytes")
 
 # 실행부
 if __name__ == '__main__':
@@ -1,178 +1,610 @@
+import io
 import os
+import shutil
 import struct
+import tempfile
+import time
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from Bio import SeqIO
+from twobit_codec import pack_reference, pack_reference_runs, pack_region, reference_codes, MaskRuns, PACK_CHUNK_BASES
+from hex_container import (HexWriter, write_hex_file, contig_lookup, BLOCK_REFERENCE, BLOCK_MASK_RUNS,
+                           BLOCK_VARIANTS, BLOCK_VARIANT_COLUMNS, BLOCK_META, BLOCK_META_COLUMNS, BLOCK_VARIANT_INDEX,
+                           BLOCK_REFERENCE_DIGEST, BLOCK_SAMPLES, BLOCK_GENOTYPES, GLOBAL_CONTIG,
+                           pack_names)
+from reference_store import ReferenceStore
+from variant_records import (VariantIndexBuilder, VariantTable, VariantColumns, pack_genotype_rows, indel_record,
+                             GT_CODE_BY_COPIES, GT_MISSING, VARIANT_INS, VARIANT_DEL)
+from vcf_reader import vcf_batches, vcf_sample_names, vcf_filter_names, iter_vcf_batches, sample_gt_columns
+from meta_records import encode_gt, meta_row, encode_meta_columns, filter_table
 
 def encode_base2bit(base):
     if base not in 'ACGT':
         return 0b00  # fallback to A (used only when masked)
     return {'A': 0b00, 'C': 0b01, 'G': 0b10, 'T': 0b11}[base]
 
-def encode_seq_fixed16(seq):
-    bits = 0
-    for base in seq:
-        bits <<= 2
-        bits |= encode_base2bit(base)
-    byte_len = (len(seq) * 2 + 7) // 8
-    return bits.to_bytes(byte_len, 'big').ljust(16, b'\x00')
-
-def encode_af(val):
-    try:
-        return int(round(min(max(float(val), 0.0), 1.0) * 255))
-    except:
-        return 0
-
-def encode_dp(val):
-    try:
-        return min(int(val), 255)
-    except:
-        return 0
-
-def encode_gt(gt_str):
-    gt = gt_str.replace('|', '/').split('/')
-    if gt == ['0', '0']:
-        return 0
-    elif '0' in gt and '1' in gt:
-        return 1
-    elif gt == ['1', '1']:
-        return 3
-    return 0
-
 def encode_reference_with_mask(fasta_path):
     record = next(SeqIO.parse(fasta_path, "fasta"))
-    seq = str(record.seq).upper()
-    bitstream = []
-    mask_bits = []
-
-    bits = 0
-    count = 0
-    for base in seq:
-        if base not in 'ACGT':
-            mask_bits.append(1)
-            base = 'A'
-        else:
-            mask_bits.append(0)
-
-        bits = (bits << 2) | encode_base2bit(base)
-        count += 1
-        if count % 4 == 0:
-            bitstream.append(bits & 0xFF)
-            bits = 0
-
-    if count % 4 != 0:
-        bits <<= (2 * (4 - (count % 4)))
-        bitstream.append(bits & 0xFF)
-
-    mask_bytes = bytearray()
-    for i in range(0, len(mask_bits), 8):
-        chunk = mask_bits[i:i+8]
-        byte = 0
-        for bit in chunk:
-            byte = (byte << 1) | bit
-        byte <<= (8 - len(chunk))  # 패딩
-        mask_bytes.append(byte)
-
-    return bytes(bitstream), mask_bytes
-
-def generate_ref_hex_with_mask(vcf_filename, fasta_filename, output_hex_filename):
+    ref_block, mask_block = pack_reference(str(record.seq))
+    return ref_block, bytearray(mask_block)
+
+# Append the record for one REF → ALT allele to out_var (and its index entry
+# to records); False when the allele has no record encoding
+def append_variant_record(out_var, records, pos, ref, alt, snp):
+    # SNP 처리
+    if snp:
+        records.append((pos, len(out_var), pos + 1))
+        out_var += b'\x00'
+        out_var += struct.pack('>I', pos)
+        out_var += bytes([encode_base2bit(ref)])
+        out_var += bytes([encode_base2bit(alt)])
+        return True
+
+    # INDEL 처리
+    if len(ref) > len(alt):  # Deletion
+        del_seq = ref[len(alt):]
+        records.append((pos, len(out_var), pos + len(del_seq)))
+        out_var += indel_record(VARIANT_DEL, pos, del_seq)
+
+    elif len(ref) < len(alt):  # Insertion
+        insert_seq = alt[len(ref):]
+        if any(b not in 'ACGT' for b in insert_seq):
+            return False
+        records.append((pos, len(out_var), pos + 1))
+        out_var += indel_record(VARIANT_INS, pos, insert_seq)
+
+    else:
+        return False
+    return True
+
+# Segment of `segments` for contig, starting a new one on a contig change
+def contig_segment(segments, contig, extra=()):
+    if not segments or segments[-1][0] != contig:
+        segments.append((contig, bytearray(), bytearray(), []) + tuple(extra))
+    return segments[-1]
+
+# Encode one VcfBatch → ([(contig, variant bytes, META bytes, [(POS, offset, end)])],
+# skipped records).
+# Consecutive records on the same contig share a segment; offsets are relative
+# to the segment. Only touches its arguments, so batches can be encoded in
+# worker processes. With filter_ids (FILTER name → bit), META
+# holds META_ROW rows for the MCOL block instead of (AF, DP, GT) triples.
+def encode_variant_batch(batch, lookup, single_contig, filter_ids=None):
+    segments = []
+    skipped_records = 0
+    columns = zip(batch.chrom, batch.pos.tolist(), batch.ref, batch.alt, batch.encoded_af().tolist(),
+                  batch.encoded_dp().tolist(), batch.gt, batch.dp.tolist(), batch.qual.tolist(), batch.filter)
+    for chrom, pos, ref, alt_field, af, dp, gt_str, raw_dp, qual, filter_str in columns:
+        # single-contig FASTA: every record belongs to it, as before
+        contig = lookup.get(chrom, 0 if single_contig else None)
+        if contig is None:
+            skipped_records += 1
+            continue
+        _, out_var, out_meta, records = contig_segment(segments, contig)
+
+        gt_str = gt_str or '0/0'
+        gt_indices = [int(g) for g in gt_str.replace('|', '/').split('/') if g.isdigit()]
+        meta = bytes([af, dp, encode_gt(gt_str)])
+
+        alt_list = alt_field.split(',')
+        if all(alt == ref for alt in alt_list):
+            continue
+
+        snp = len(ref) == 1 and all(len(alt) == 1 for alt in alt_list)
+        for idx in set(gt_indices):
+            if idx == 0 or idx > len(alt_list):
+                continue
+            if append_variant_record(out_var, records, pos, ref, alt_list[idx - 1], snp):
+                if filter_ids is None:
+                    out_meta += meta
+                else:
+                    out_meta += meta_row(af, raw_dp, gt_str, idx, qual, filter_str, filter_ids)
+    return segments, skipped_records
+
+# Cohort counterpart of encode_variant_batch (batch read with genotypes=True):
+# every ALT allele carried by at least one sample becomes one record, and its
+# per-sample genotype codes one row of the segment's GTMX rows (5th element).
+# META keeps AF/DP; its GT byte is GT_MISSING since genotypes live in GTMX.
+def encode_cohort_batch(batch, lookup, single_contig, filter_ids=None):
+    segments = []
+    skipped_records = 0
+    columns = zip(batch.chrom, batch.pos.tolist(), batch.ref, batch.alt, batch.encoded_af().tolist(),
+                  batch.encoded_dp().tolist(), batch.genotypes, batch.dp.tolist(), batch.qual.tolist(), batch.filter)
+    for chrom, pos, ref, alt_field, af, dp, alleles, raw_dp, qual, filter_str in columns:
+        contig = lookup.get(chrom, 0 if single_contig else None)
+        if contig is None:
+            skipped_records += 1
+            continue
+        _, out_var, out_meta, records, rows = contig_segment(segments, contig, ([],))
+
+        meta = bytes([af, dp, GT_MISSING])
+        missing = (alleles < 0).any(axis=1)
+        alt_list = alt_field.split(',')
+        snp = len(ref) == 1 and all(len(alt) == 1 for alt in alt_list)
+        for idx, alt in enumerate(alt_list, 1):
+            if alt == ref:
+                continue
+            copies = (alleles == idx).sum(axis=1)
+            if not copies.any():
+                continue
+            if append_variant_record(out_var, records, pos, ref, alt, snp):
+                if filter_ids is None:
+                    out_meta += meta
+                else:
+                    out_meta += meta_row(af, raw_dp, None, idx, qual, filter_str, filter_ids)
+                codes = GT_CODE_BY_COPIES[copies]
+                codes[missing] = GT_MISSING
+                rows.append(codes)
+    return segments, skipped_records
+
+# Collects encoded segments into one contiguous variant/META section per
+# contig, written to var_file/meta_file (real files or BytesIO)
+class SectionWriter:
+    def __init__(self, var_file, meta_file, contigs):
+        self.var_file = var_file
+        self.meta_file = meta_file
+        self.contigs = contigs
+        self.sections = {}
+        self.section = None
+        self.variant_count = 0
+
+    def add(self, segments):
+        for contig, var_data, meta_data, records, *_ in segments:
+            section = self.section
+            if section is None or section['contig'] != contig:
+                if contig in self.sections:
+                    raise ValueError(f"VCF records for contig '{self.contigs[contig][0]}' are not contiguous")
+                close_section(section, self.var_file, self.meta_file)
+                section = {'contig': contig, 'var_start': self.var_file.tell(),
+                           'meta_start': self.meta_file.tell(), 'index': VariantIndexBuilder()}
+                self.sections[contig] = section
+                self.section = section
+            base = self.var_file.tell() - section['var_start']
+            for pos, offset, end in records:
+                section['index'].add(pos, base + offset, end)
+            self.var_file.write(var_data)
+            self.meta_file.write(meta_data)
+            self.variant_count += len(records)
+
+    def close(self):
+        close_section(self.section, self.var_file, self.meta_file)
+
+# A contig's variant/META section ends where the next one starts
+def close_section(section, var_file, meta_file):
+    if section is not None:
+        section['var_end'] = var_file.tell()
+        section['meta_end'] = meta_file.tell()
+
+# fn over items on pool, results in input order, at most `ahead` tasks in flight
+def ordered_map(pool, fn, items, ahead):
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, *item))
+        if len(pending) >= ahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+# Every FASTA record → ([(name, length)], packed reference). Each record is
+# packed as soon as it is parsed, so only one contig's text is held at a time:
+# in this process → [(reference block, NRUN block)], or with a pool its
+# regions are queued there → per-contig futures for join_reference.
+def read_fasta(fasta_path, pool=None):
+    contigs = []
+    packed = []
+    for record in SeqIO.parse(fasta_path, "fasta"):
+        seq = str(record.seq)
+        contigs.append((record.id, len(seq)))
+        packed.append(pack_reference_runs(seq) if pool is None else submit_reference(pool, seq))
+    return contigs, packed
+
+# Queue the regions of one contig on pool, PACK_CHUNK_BASES each
+def submit_reference(pool, seq):
+    return [pool.submit(pack_region, seq[start:start + PACK_CHUNK_BASES], start)
+            for start in range(0, len(seq), PACK_CHUNK_BASES)]
+
+# Per-contig region futures → [(reference block, NRUN block)] per contig
+def join_reference(pending):
+    packed = []
+    for futures in pending:
+        pieces = [future.result() for future in futures]
+        packed.append((b''.join(ref for ref, _ in pieces),
+                       MaskRuns.concat([runs for _, runs in pieces]).to_bytes()))
+    return packed
+
+# FILTER names → {name: bit} for the batch encoders (None stays None)
+def filter_lookup(filter_names):
+    return {name: k for k, name in enumerate(filter_names)} if filter_names is not None else None
+
+# Base codes of one packed (reference block, NRUN block) pair at 0-based
+# positions, as HexContainer.reference_codes reads them back
+def packed_reference_codes(ref_block, mask_block):
+    return partial(reference_codes, ref_block, MaskRuns.from_block(mask_block))
+
+# VARS section bytes → VCOL block; reference (positions → base codes) also
+# leaves SNP REF out of it, with verify_ref after checking it (ValueError on a mismatch)
+def encode_variant_columns(data, reference=None, verify_ref=True):
+    return VariantColumns.encode(VariantTable.from_block(data), reference, verify_ref)
+
+# VARS section bytes → (block kind, data): the records as they are, or, with
+# columns, a VCOL block
+def variant_block(data, columns=False, reference=None, verify_ref=True):
+    if not columns:
+        return BLOCK_VARIANTS, data
+    return BLOCK_VARIANT_COLUMNS, encode_variant_columns(data, reference, verify_ref)
+
+# Reference lookup for variant_block with reference_snps, else None
+def snp_reference_lookup(packed, contig, reference_snps):
+    return packed_reference_codes(*packed[contig]) if reference_snps else None
+
+# META section bytes → (block kind, data): the (AF, DP, GT) triples as they
+# are, or, with filter_names, META rows turned into an MCOL block
+def meta_block(data, filter_names=None):
+    if filter_names is None:
+        return BLOCK_META, data
+    return BLOCK_META_COLUMNS, encode_meta_columns(data, filter_names)
+
+# Per-contig variant/META/VIDX blocks, then the reference (or its store
+# digest), in the order generate_ref_hex_with_mask streams them. VCOL blocks
+# (columns / reference_snps) carry their own checkpoints, so get no VIDX.
+def build_blocks(packed, sections, var_data, meta_data, digest=None, filter_names=None, columns=False,
+                 reference_snps=False, verify_ref=True):
+    columns = columns or reference_snps
+    blocks = []
+    for contig, sec in sections.items():
+        kind, data = variant_block(var_data[sec['var_start']:sec['var_end']], columns,
+                                   snp_reference_lookup(packed, contig, reference_snps), verify_ref)
+        blocks.append((kind, contig, data))
+    for contig, sec in sections.items():
+        kind, data = meta_block(meta_data[sec['meta_start']:sec['meta_end']], filter_names)
+        blocks.append((kind, contig, data))
+    for contig, sec in sections.items():
+        index_data = sec['index'].to_bytes() if not columns else b''
+        if index_data:
+            blocks.append((BLOCK_VARIANT_INDEX, contig, index_data))
+    if digest is not None:
+        blocks.append((BLOCK_REFERENCE_DIGEST, GLOBAL_CONTIG, bytes.fromhex(digest)))
+    else:
+        for contig, (ref_block, mask_block) in enumerate(packed):
+            blocks.append((BLOCK_REFERENCE, contig, ref_block))
+            blocks.append((BLOCK_MASK_RUNS, contig, mask_block))
+    return blocks
+
+# Block table room of a sample file: REF, NRUN, VARS, META, VIDX per contig
+# plus the reference digest
+def sample_block_limit(contigs):
+    return 5 * len(contigs) + 1
+
+# Blocks of a sample file from its spooled sections, laid out as build_blocks
+# does: variant (VARS or VCOL) and META blocks read from var_spool/meta_spool
+# (var_spool may be out itself), VIDX, then the reference or its store digest
+def add_sample_blocks(out, var_spool, meta_spool, sections, packed, digest=None, filter_names=None,
+                      columns=False, reference_snps=False, verify_ref=True):
+    columns = columns or reference_snps
+    if not columns:
+        add_sections(out, var_spool, BLOCK_VARIANTS, 'var', sections)
+    else:
+        add_sections(out, var_spool, BLOCK_VARIANT_COLUMNS, 'var', sections,
+                     lambda contig, data: encode_variant_columns(
+                         data, snp_reference_lookup(packed, contig, reference_snps), verify_ref))
+    if filter_names is None:
+        add_sections(out, meta_spool, BLOCK_META, 'meta', sections)
+    else:
+        add_sections(out, meta_spool, BLOCK_META_COLUMNS, 'meta', sections,
+                     lambda contig, data: encode_meta_columns(data, filter_names))
+    for contig, sec in sections.items():
+        index_data = sec['index'].to_bytes() if not columns else b''
+        if index_data:
+            out.add_block(BLOCK_VARIANT_INDEX, contig, index_data)
+
+    if digest is not None:
+        out.add_block(BLOCK_REFERENCE_DIGEST, GLOBAL_CONTIG, bytes.fromhex(digest))
+    else:
+        for contig, (ref_block, mask_block) in enumerate(packed):
+            out.add_block(BLOCK_REFERENCE, contig, ref_block)
+            out.add_block(BLOCK_MASK_RUNS, contig, mask_block)
+
+# META bytes kept in memory before the META spill buffer moves to a temp file
+META_SPILL_BYTES = 1 << 26
+
+# Register every contig's `key` ('var' or 'meta') section of spool as a `kind`
+# block. Raw sections stay where they are (spool is the output itself) or are
+# copied over in one go; sections of a compressed kind, or that
+# encode(contig, data) turns into other block data (e.g. META rows into MCOL),
+# are read back one at a time and added as whole blocks.
+def add_sections(out, spool, kind, key, sections, encode=None):
+    start, end = f'{key}_start', f'{key}_end'
+    if kind in out.codecs or encode is not None:
+        for contig, sec in sections.items():
+            spool.seek(sec[start])
+            data = spool.read(sec[end] - sec[start])
+            out.add_block(kind, contig, encode(contig, data) if encode is not None else data)
+        return
+    base = 0
+    if spool is not out:
+        base = out.tell()
+        spool.seek(0)
+        shutil.copyfileobj(spool, out)
+    for contig, sec in sections.items():
+        out.add_entry(kind, contig, base + sec[start], sec[end] - sec[start])
+
+# With reference_store (a store directory), the reference goes into the shared
+# content-addressed store and the output only carries its digest. With
+# workers > 1, reference regions and VCF batches are encoded on a process pool
+# and stitched back in input order; the output is byte-identical to workers=1.
+# codecs maps block kinds to a block codec (e.g. {BLOCK_REFERENCE: 'zstd',
+# BLOCK_VARIANTS: 'lzma'}); other kinds are stored raw. meta_columns=True
+# writes MCOL blocks (phased/multi-allelic GT, log-scaled DP, QUAL, FILTER)
+# instead of the (AF, DP, GT) META triples. columns=True writes the variants
+# as VCOL blocks instead of VARS + VIDX; reference_snps=True (implies columns)
+# also leaves SNP REF out of them, after checking it against the FASTA unless
+# verify_ref=False (as for combine_blocks).
+def generate_ref_hex_with_mask(vcf_filename, fasta_filename, output_hex_filename, reference_store=None,
+                               workers=1, codecs=None, meta_columns=False, columns=False, reference_snps=False,
+                               verify_ref=True):
     base_dir = os.path.dirname(os.path.abspath(__file__))
     vcf_path = os.path.join(base_dir, vcf_filename)
     fasta_path = os.path.join(base_dir, fasta_filename)
-    variant_bin = os.path.join(base_dir, "ref_variants.bin")
-    meta_bin = os.path.join(base_dir, "meta_variants.bin")
 
-    variant_count = 0
+    filter_names = filter_table(vcf_filter_names(vcf_path)) if meta_columns else None
+    columns = columns or reference_snps
+    with (ProcessPoolExecutor(workers) if workers > 1 else nullcontext()) as pool:
+        # 1. Every FASTA record, in a single pass; with a pool its regions are
+        # queued first, so they overlap VCF parsing
+        contigs, packed = read_fasta(fasta_path, pool)
+        lookup = contig_lookup(name for name, _ in contigs)
+        encode_batch = partial(encode_variant_batch, lookup=lookup, single_contig=len(contigs) == 1,
+                               filter_ids=filter_lookup(filter_names))
+        if pool is None:
+            encoded_batches = (encode_batch(batch) for batch in vcf_batches(vcf_path))
+        else:
+            encoded_batches = ordered_map(pool, encode_batch, ((batch,) for batch in vcf_batches(vcf_path)),
+                                          2 * workers)
 
-    with open(vcf_path, 'r') as vcf, \
-         open(variant_bin, 'wb') as out_var, \
-         open(meta_bin, 'wb') as out_meta:
+        # 2. Variant records stream straight into the output file; META (3 B per
+        # variant) collects in a spill buffer that only goes to disk when large.
+        # A compressed or column-encoded variant block is spilled the same way and
+        # added whole.
+        skipped_records = 0
+        with HexWriter(output_hex_filename, contigs, sample_block_limit(contigs), codecs) as out, \
+             tempfile.SpooledTemporaryFile(META_SPILL_BYTES) as out_meta, \
+             tempfile.SpooledTemporaryFile(META_SPILL_BYTES) as var_spill:
 
-        for line in vcf:
-            if line.startswith('#'):
-                continue
+            out_var = var_spill if BLOCK_VARIANTS in out.codecs or columns else out
+            writer = SectionWriter(out_var, out_meta, contigs)
+            for segments, skipped in encoded_batches:
+                skipped_records += skipped
+                writer.add(segments)
+            writer.close()
 
-            parts = line.strip().split('\t')
-            pos = int(parts[1])
-            ref = parts[3]
-            alt_field = parts[4]
-            info = parts[7]
-            format_tags = parts[8].split(':')
-            sample_values = parts[9].split(':')
-
-            info_dict = dict(i.split('=') for i in info.split(';') if '=' in i)
-            af = encode_af(info_dict.get('AF', 0))
-            dp = encode_dp(info_dict.get('DP', 0))
-            gt_str = sample_values[format_tags.index('GT')] if 'GT' in format_tags else '0/0'
-            gt_indices = [int(g) for g in gt_str.replace('|', '/').split('/') if g.isdigit()]
-
-            alt_list = alt_field.split(',')
-            if all(alt == ref for alt in alt_list):
-                continue
+            # the packed reference is needed before the variant blocks (SNP REF checks)
+            if pool is not None:
+                packed = join_reference(packed)
 
-            # SNP 처리
-            if len(ref) == 1 and all(len(alt) == 1 for alt in alt_list):
-                for idx in set(gt_indices):
-                    if idx == 0 or idx > len(alt_list):
-                        continue
-                    alt = alt_list[idx - 1]
-                    out_var.write(b'\x00')
-                    out_var.write(struct.pack('>I', pos))
-                    out_var.write(bytes([encode_base2bit(ref)]))
-                    out_var.write(bytes([encode_base2bit(alt)]))
-                    out_meta.write(bytes([af, dp, encode_gt(gt_str)]))
-                    variant_count += 1
-                continue
+            # 3. Variant/META/VIDX blocks, then the reference blocks or the
+            # digest of the shared copy
+            digest = None
+            if reference_store is not None:
+                digest = ReferenceStore(reference_store).put(contigs, packed)
+                print(f" shared reference: {digest}")
+            add_sample_blocks(out, out_var, out_meta, writer.sections, packed, digest, filter_names,
+                              columns, reference_snps, verify_ref)
 
-            # INDEL 처리
-            for idx in set(gt_indices):
-                if idx == 0 or idx > len(alt_list):
-                    continue
-                alt = alt_list[idx - 1]
-
-                if len(ref) > len(alt):  # Deletion
-                    del_seq = ref[len(alt):]
-                    del_len = len(del_seq)
-                    encoded = encode_seq_fixed16(del_seq)
-                    out_var.write(b'\x02')
-                    out_var.write(struct.pack('>I', pos))
-                    out_var.write(struct.pack('B', del_len))
-                    out_var.write(encoded)
-
-                elif len(ref) < len(alt):  # Insertion
-                    insert_seq = alt[len(ref):]
-                    if any(b not in 'ACGT' for b in insert_seq):
-                        continue
-                    insert_seq = insert_seq[:64]
-                    encoded = encode_seq_fixed16(insert_seq)
-                    out_var.write(b'\x01')
-                    out_var.write(struct.pack('>I', pos))
-                    out_var.write(struct.pack('B', len(insert_seq)))
-                    out_var.write(encoded)
+    print(f" HEX created to: {output_hex_filename}")
+    print(f" number of contigs: {len(contigs)}")
+    print(f" number of all mutations: {writer.variant_count}개")
+    if skipped_records:
+        print(f" VCF records on contigs missing from the FASTA: {skipped_records}")
+    return output_hex_filename
 
-                else:
-                    continue
 
-                out_meta.write(bytes([af, dp, encode_gt(gt_str)]))
-                variant_count += 1
+# --- Batch mode: many samples, one reference pass ---
+
+# Records per VCF batch in batch mode shrink with the sample count (as in
+# cohort mode), so a batch's sample text stays around this many calls
+BATCH_SAMPLE_CALLS = 1 << 22
+
+# Encode one VcfBatch (read with sample_text=True) for each of `samples` →
+# ([(sample, (segments, skipped records, long indels))], VCF records,
+# seconds). Runs in a worker process in batch mode; the samples' GT columns are
+# split out of the shared sample text once for the whole group.
+def encode_sample_group(batch, samples, lookup, single_contig, filter_ids=None):
+    started = time.perf_counter()
+    results = [(sample, encode_variant_batch(batch.with_gt(gt), lookup, single_contig, filter_ids))
+               for sample, gt in zip(samples, sample_gt_columns(batch, samples))]
+    return results, len(batch), time.perf_counter() - started
+
+# Variant/META bytes a batch-mode sample keeps in memory before its spool
+# files move to disk
+SAMPLE_SPILL_BYTES = 1 << 20
+
+# Per-sample state of batch mode while one VCF is encoded. The sample's
+# sections are spooled to temp files, so memory stays bounded however many
+# samples a VCF has.
+class SampleSections:
+    def __init__(self, contigs):
+        self.var_spool = tempfile.SpooledTemporaryFile(SAMPLE_SPILL_BYTES)
+        self.meta_spool = tempfile.SpooledTemporaryFile(SAMPLE_SPILL_BYTES)
+        self.writer = SectionWriter(self.var_spool, self.meta_spool, contigs)
+        self.records = 0
+        self.skipped = 0
+        self.seconds = 0.0
+
+    # The sample file at path, streamed from the spools (see add_sample_blocks)
+    def write(self, path, contigs, packed, digest=None, filter_names=None, codecs=None, columns=False,
+              reference_snps=False, verify_ref=True):
+        with HexWriter(path, contigs, sample_block_limit(contigs), codecs) as out:
+            add_sample_blocks(out, self.var_spool, self.meta_spool, self.writer.sections, packed, digest,
+                              filter_names, columns, reference_snps, verify_ref)
+            return out.close()
 
-    ref_block, mask_block = encode_reference_with_mask(fasta_path)
+    def close(self):
+        self.var_spool.close()
+        self.meta_spool.close()
+
+# Encode the given sample columns of one VCF, tokenizing it once →
+# {sample: SampleSections}. Every batch is split into up to `workers` sample
+# groups encoded on pool, with at most 2 * workers tasks in flight, or all
+# in this process when pool is None.
+def encode_vcf_samples(pool, vcf_path, samples, contigs, lookup, filter_ids=None, workers=1):
+    encode = partial(encode_sample_group, lookup=lookup, single_contig=len(contigs) == 1, filter_ids=filter_ids)
+    size = -(-len(samples) // max(1, min(workers, len(samples))))
+    groups = [samples[k:k + size] for k in range(0, len(samples), size)]
+    batches = iter_vcf_batches(vcf_path, max(1, BATCH_SAMPLE_CALLS // len(samples)), sample_text=True)
+    tasks = ((batch, group) for batch in batches for group in groups)
+    if pool is None:
+        results = (encode(*task) for task in tasks)
+    else:
+        results = ordered_map(pool, encode, tasks, 2 * workers)
+
+    state = {sample: SampleSections(contigs) for sample in samples}
+    for group, records, seconds in results:
+        for sample, (segments, skipped) in group:
+            sections = state[sample]
+            sections.writer.add(segments)
+            sections.records += records
+            sections.skipped += skipped
+            sections.seconds += seconds / len(group)
+    for sections in state.values():
+        sections.writer.close()
+    return state
+
+# (vcf path, sample column, output name) for every sample of every VCF;
+# names are the VCF sample names, prefixed with the file name on clashes
+def sample_jobs(vcf_paths):
+    jobs = []
+    used = set()
+    for vcf_path in vcf_paths:
+        stem = os.path.basename(vcf_path).split('.vcf')[0]
+        names = vcf_sample_names(vcf_path) or [stem]
+        for sample, name in enumerate(names):
+            if name in used:
+                name = f"{stem}.{name}"
+            used.add(name)
+            jobs.append((vcf_path, sample, name))
+    return jobs
+
+# Encode every sample of vcf_filenames (a list of VCFs, or one multi-sample
+# VCF) against one reference pack: the FASTA is read and packed once and each
+# sample becomes output_dir/<sample>.hex. Each VCF is read and tokenized once;
+# its batches are encoded for groups of samples on a pool of `workers`
+# processes. Returns one throughput report per sample (seconds are each
+# sample's share of its groups' encoding time). meta_columns, columns,
+# reference_snps and verify_ref work as for generate_ref_hex_with_mask.
+def generate_batch_hex(vcf_filenames, fasta_filename, output_dir, reference_store=None, workers=1,
+                       codecs=None, meta_columns=False, columns=False, reference_snps=False, verify_ref=True):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    if isinstance(vcf_filenames, str):
+        vcf_filenames = [vcf_filenames]
+    vcf_paths = [os.path.join(base_dir, name) for name in vcf_filenames]
+    fasta_path = os.path.join(base_dir, fasta_filename)
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+
+    jobs = sample_jobs(vcf_paths)
+    filter_names = {path: filter_table(vcf_filter_names(path)) if meta_columns else None for path in vcf_paths}
+    reports = []
+    with (ProcessPoolExecutor(workers) if workers > 1 else nullcontext()) as pool:
+        # reference regions are queued first, so they overlap encoding the first VCF
+        contigs, packed = read_fasta(fasta_path, pool)
+        lookup = contig_lookup(name for name, _ in contigs)
+        digest = None
+        for k, vcf_path in enumerate(vcf_paths):
+            names = {sample: name for path, sample, name in jobs if path == vcf_path}
+            encoded = encode_vcf_samples(pool, vcf_path, list(names), contigs, lookup,
+                                         filter_lookup(filter_names[vcf_path]), workers)
+            if k == 0:
+                if pool is not None:
+                    packed = join_reference(packed)
+                print(f" reference packed once: {len(contigs)} contigs, {time.perf_counter() - started:.2f}s")
+                if reference_store is not None:
+                    digest = ReferenceStore(reference_store).put(contigs, packed)
+                    print(f" shared reference: {digest}")
+
+            for sample, name in names.items():
+                sample_sections = encoded.pop(sample)
+                writer = sample_sections.writer
+                records, seconds = sample_sections.records, sample_sections.seconds
+                output_path = os.path.join(output_dir, f"{name}.hex")
+                try:
+                    size = sample_sections.write(output_path, contigs, packed, digest, filter_names[vcf_path],
+                                                 codecs, columns, reference_snps, verify_ref)
+                finally:
+                    sample_sections.close()
+                report = {'sample': name, 'output': output_path, 'records': records,
+                          'variants': writer.variant_count, 'skipped': sample_sections.skipped,
+                          'seconds': seconds, 'bytes': size,
+                          'records_per_second': records / seconds if seconds else 0.0}
+                reports.append(report)
+                print(f" {name}: {writer.variant_count} variants from {records} records in {seconds:.2f}s "
+                      f"({report['records_per_second']:,.0f} records/s), {size} bytes → {output_path}")
+
+    total = time.perf_counter() - started
+    print(f" {len(reports)} samples in {total:.2f}s ({len(reports) / total:.2f} samples/s)")
+    return reports
+
+
+# --- Cohort mode: every sample of a multi-sample VCF in one file ---
+
+# Genotype calls per VCF batch in cohort mode (batch rows = this / samples)
+COHORT_BATCH_CALLS = 1 << 24
+
+# One container for a whole cohort: the ALT alleles any sample carries as
+# VARS/META/VIDX, every sample's genotype at each of them as a 2-bit GTMX
+# matrix per contig, and the sample names in a SMPL block. meta_columns,
+# columns, reference_snps and verify_ref work as for generate_ref_hex_with_mask;
+# GTMX rows follow the VCOL record order just as they follow VARS.
+def generate_cohort_hex(vcf_filename, fasta_filename, output_hex_filename, reference_store=None, codecs=None,
+                        meta_columns=False, columns=False, reference_snps=False, verify_ref=True):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    vcf_path = os.path.join(base_dir, vcf_filename)
+    fasta_path = os.path.join(base_dir, fasta_filename)
 
-    with open(output_hex_filename, 'wb') as out_hex, \
-         open(variant_bin, 'rb') as in_var, \
-         open(meta_bin, 'rb') as in_meta:
+    samples = vcf_sample_names(vcf_path)
+    if not samples:
+        raise ValueError(f"'{vcf_path}' has no sample columns")
+    contigs, packed = read_fasta(fasta_path)
+    lookup = contig_lookup(name for name, _ in contigs)
+    filter_names = filter_table(vcf_filter_names(vcf_path)) if meta_columns else None
+    filter_ids = filter_lookup(filter_names)
 
-        var_data = in_var.read()
-        meta_data = in_meta.read()
+    var_buf = io.BytesIO()
+    meta_buf = io.BytesIO()
+    writer = SectionWriter(var_buf, meta_buf, contigs)
+    genotype_rows = {}
+    skipped_records = 0
+    batch_size = max(1, COHORT_BATCH_CALLS // len(samples))
+    for batch in iter_vcf_batches(vcf_path, batch_size, genotypes=True):
+        if batch.genotypes.shape[1] != len(samples):
+            raise ValueError(f"'{vcf_path}' has records without all {len(samples)} sample columns")
+        segments, skipped = encode_cohort_batch(batch, lookup, len(contigs) == 1, filter_ids)
+        skipped_records += skipped
+        writer.add(segments)
+        for contig, _, _, _, rows in segments:
+            if rows:
+                genotype_rows.setdefault(contig, []).append(pack_genotype_rows(rows))
+    writer.close()
 
-        out_hex.write(ref_block)
-        out_hex.write(mask_block)
-        out_hex.write(var_data)
-        out_hex.write(b'META')
-        out_hex.write(struct.pack('>I', len(meta_data)))
-        out_hex.write(meta_data)
+    digest = None
+    if reference_store is not None:
+        digest = ReferenceStore(reference_store).put(contigs, packed)
+        print(f" shared reference: {digest}")
+    blocks = build_blocks(packed, writer.sections, var_buf.getvalue(), meta_buf.getvalue(), digest, filter_names,
+                          columns, reference_snps, verify_ref)
+    blocks.append((BLOCK_SAMPLES, GLOBAL_CONTIG, pack_names(samples)))
+    for contig, parts in genotype_rows.items():
+        blocks.append((BLOCK_GENOTYPES, contig, b''.join(parts)))
+    write_hex_file(output_hex_filename, contigs, blocks, codecs)
 
     print(f" HEX created to: {output_hex_filename}")
-    print(f" number of all mutations: {variant_count}개")
+    print(f" number of samples: {len(samples)}")
+    print(f" number of all mutations: {writer.variant_count}개")
+    if skipped_records:
+        print(f" VCF records on contigs missing from the FASTA: {skipped_records}")
     return output_hex_filename
 
 # 실행 예시
-generate_ref_hex_with_mask("HG00157.chr11.vcf", "chr11.fasta", "chr11_fasta_with_ref_N_masking.hex")
+if __name__ == "__main__":
+    generate_ref_hex_with_mask("HG00157.chr11.vcf", "chr11.fasta", "chr11_fasta_with_ref_N_masking.hex")
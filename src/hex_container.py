@@ -0,0 +1,537 @@
+import mmap
+import os
+import struct
+from functools import partial
+import numpy as np
+from twobit_codec import decode_reference, unpack_bases, apply_mask, reference_codes, MaskRuns
+from block_codec import CODEC_RAW, CompressedBlock, compress_block, codec_id
+from variant_records import (query_records, iter_patched_sequence, GenotypeMatrix, VariantTable,
+                             VariantColumns, VARIANT_DEL, UNKNOWN_BASE)
+from meta_records import MetaColumns, MetaTriples
+
+META_MARKER = b'META'
+
+# --- Self-describing header (version 1) ---
+#   prefix : magic '2BVF', version, flags, contig count, block count, header size
+#   contigs: u16 name length, name (ascii), u32 length in bases
+#   blocks : kind tag, contig index, codec, reserved, u64 offset, u64 size
+# Block offsets are absolute, so any block is one seek away once the header
+# (a few hundred bytes) has been read.
+MAGIC = b'2BVF'
+FORMAT_VERSION = 1
+
+HEADER_PREFIX = struct.Struct('>4sBBHHI')
+CONTIG_ENTRY = struct.Struct('>H')
+CONTIG_LENGTH = struct.Struct('>I')
+BLOCK_ENTRY = struct.Struct('>4sHBBQQ')
+
+BLOCK_REFERENCE = b'REF '
+BLOCK_MASK = b'MASK'
+BLOCK_MASK_RUNS = b'NRUN'
+BLOCK_VARIANTS = b'VARS'
+BLOCK_VARIANT_COLUMNS = b'VCOL'
+BLOCK_META = b'META'
+BLOCK_META_COLUMNS = b'MCOL'
+BLOCK_VARIANT_INDEX = b'VIDX'
+BLOCK_REFERENCE_DIGEST = b'RDGT'
+BLOCK_SAMPLES = b'SMPL'
+BLOCK_GENOTYPES = b'GTMX'
+
+# Contig index used by blocks that belong to the whole file
+GLOBAL_CONTIG = 0xFFFF
+
+# --- Shared reference store ---
+# Reference-free sample files carry a RDGT block (sha256 of the reference
+# container's contigs, reference and mask blocks) instead of REF/MASK. The
+# reference itself lives once in a store directory as <root>/<ab>/<digest>.hex.
+REFERENCE_STORE_ENV = 'HEX_REFERENCE_STORE'
+DEFAULT_STORE_DIR = 'reference_store'
+
+def reference_store_path(root, digest):
+    return os.path.join(root, digest[:2], digest + '.hex')
+
+# Store directory used when none is given, by writers (ReferenceStore) and
+# readers alike: $HEX_REFERENCE_STORE, else DEFAULT_STORE_DIR in the working
+# directory
+def default_reference_store():
+    return os.environ.get(REFERENCE_STORE_ENV) or DEFAULT_STORE_DIR
+
+
+def header_size(contigs, n_blocks):
+    names = sum(CONTIG_ENTRY.size + len(name.encode('ascii')) + CONTIG_LENGTH.size for name, _ in contigs)
+    return HEADER_PREFIX.size + names + n_blocks * BLOCK_ENTRY.size
+
+
+# Map contig names to indices, accepting both 'chr11' and '11' spellings
+def contig_lookup(names):
+    names = list(names)
+    lookup = {}
+    for idx, name in enumerate(names):
+        bare = name[3:] if name.startswith('chr') else name
+        for alias in (bare, 'chr' + bare):
+            lookup.setdefault(alias, idx)
+    for idx, name in enumerate(names):
+        lookup[name] = idx
+    return lookup
+
+
+# Cohort files list their samples in a global SMPL block, encoded like
+# contig names ('>H' length + ASCII name each)
+def pack_names(names):
+    parts = []
+    for name in names:
+        name = name.encode('ascii')
+        parts.append(CONTIG_ENTRY.pack(len(name)) + name)
+    return b''.join(parts)
+
+def unpack_names(block):
+    names = []
+    i = 0
+    while i < len(block):
+        n = CONTIG_ENTRY.unpack_from(block, i)[0]
+        i += CONTIG_ENTRY.size
+        names.append(bytes(block[i:i + n]).decode('ascii'))
+        i += n
+    return names
+
+
+# contigs: [(name, length)], blocks: [(kind, contig index, offset, size[, codec])].
+# reserved pads the header to a longer length (see HexWriter).
+def pack_header(contigs, blocks, flags=0, reserved=None):
+    actual = header_size(contigs, len(blocks))
+    reserved = actual if reserved is None else reserved
+    parts = [HEADER_PREFIX.pack(MAGIC, FORMAT_VERSION, flags, len(contigs), len(blocks), reserved)]
+    for name, length in contigs:
+        name = name.encode('ascii')
+        parts.append(CONTIG_ENTRY.pack(len(name)) + name + CONTIG_LENGTH.pack(length))
+    for kind, contig, offset, size, *codec in blocks:
+        parts.append(BLOCK_ENTRY.pack(kind, contig, codec[0] if codec else CODEC_RAW, 0, offset, size))
+    parts.append(b'\x00' * (reserved - actual))
+    return b''.join(parts)
+
+
+# Write a complete container; blocks: [(kind, contig index, data)]. codecs
+# maps block kinds to the codec they are stored with (see block_codec).
+def write_hex_file(path, contigs, blocks, codecs=None, workers=None):
+    codecs = {kind: codec_id(codec) for kind, codec in (codecs or {}).items()}
+    offset = header_size(contigs, len(blocks))
+    entries = []
+    stored = []
+    for kind, contig, data in blocks:
+        codec = codecs.get(kind, CODEC_RAW)
+        data = compress_block(data, codec, workers=workers)
+        entries.append((kind, contig, offset, len(data), codec))
+        stored.append(data)
+        offset += len(data)
+
+    with open(path, 'wb') as out:
+        out.write(pack_header(contigs, entries))
+        for data in stored:
+            out.write(data)
+    return offset
+
+
+# Write a container block by block without holding it in memory: room for
+# max_blocks table entries is reserved up front and the header is patched in
+# by close(). Data can be added as whole blocks (add_block) or written
+# through write() and registered afterwards (add_entry), so encoders can
+# stream a block straight into place. add_block stores each kind with its
+# codec from codecs (chunks compressed on `workers` threads).
+class HexWriter:
+    def __init__(self, path, contigs, max_blocks, codecs=None, workers=None):
+        self.path = path
+        self.contigs = contigs
+        self.max_blocks = max_blocks
+        self.codecs = {kind: codec_id(codec) for kind, codec in (codecs or {}).items()}
+        self.workers = workers
+        self.entries = []
+        self.file = open(path, 'wb')
+        self.file.write(b'\x00' * header_size(contigs, max_blocks))
+
+    def tell(self):
+        return self.file.tell()
+
+    def write(self, data):
+        return self.file.write(data)
+
+    def add_entry(self, kind, contig, offset, size, codec=CODEC_RAW):
+        if len(self.entries) == self.max_blocks:
+            raise ValueError(f"more than the {self.max_blocks} reserved blocks in '{self.path}'")
+        self.entries.append((kind, contig, offset, size, codec))
+
+    def add_block(self, kind, contig, data):
+        codec = self.codecs.get(kind, CODEC_RAW)
+        data = compress_block(data, codec, workers=self.workers)
+        offset = self.tell()
+        self.write(data)
+        self.add_entry(kind, contig, offset, len(data), codec)
+
+    # Patch the header in; returns the file size
+    def close(self):
+        total = self.tell()
+        self.file.seek(0)
+        self.file.write(pack_header(self.contigs, self.entries, reserved=header_size(self.contigs, self.max_blocks)))
+        self.file.close()
+        return total
+
+    def __enter__(self):
+        return self
+
+    # A failed encode leaves no half-written container behind
+    def __exit__(self, exc_type, exc, tb):
+        if self.file.closed:
+            return
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(self.path)
+
+
+# Read-only, zero-copy view of a .hex file. The file is mmapped once and every
+# block is exposed as a memoryview slice, so nothing is copied and worker
+# processes opening the same file share the OS page cache.
+#
+# Blocks, and the tables and views built on them (variant_table, query,
+# metadata, ...), read straight from the mapping and are only valid until
+# close(); call .copy() on a VariantTable, MetaColumns or MetaTriples to keep
+# it past the `with` block.
+#
+# Files written with a header locate their blocks through the block table.
+# Older headerless files ([reference][mask][variants]['META'][u32 len][meta])
+# need ref_length passed in; leaving it out opens them as reference-free
+# (fasta free) files.
+#
+# Sample files that point at a shared reference get its REF/MASK blocks
+# mapped in automatically (attach_reference=False skips that). The store is
+# looked up in reference_store, then in the default store
+# (default_reference_store()).
+class HexContainer:
+    def __init__(self, path, ref_length=None, reference_store=None, attach_reference=True):
+        self.path = path
+        self.shared_reference = None
+
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file cannot be mapped
+            self._file.close()
+            raise ValueError(f"'{path}' is empty")
+        self.buffer = memoryview(self._mmap)
+        self.blocks = {}    # stored bytes of every block
+        self.codecs = {}
+        self._decoded = {}  # decompressed copies of non-raw blocks
+        self._compressed = {}
+        self._columns = {}
+
+        try:
+            if self.buffer[:4] == MAGIC:
+                self._read_header()
+                if attach_reference and (BLOCK_REFERENCE_DIGEST, GLOBAL_CONTIG) in self.blocks:
+                    self._attach_reference(reference_store)
+                if ref_length is not None and ref_length != self.ref_length:
+                    raise ValueError(f"'{path}' holds a {self.ref_length} bp reference, not {ref_length} bp")
+            else:
+                self._read_legacy(ref_length or 0)
+        except Exception:
+            self.close()
+            raise
+
+    def _read_header(self):
+        if len(self.buffer) < HEADER_PREFIX.size:
+            raise ValueError(f"'{self.path}' has a truncated header")
+        _, version, self.flags, n_contigs, n_blocks, size = HEADER_PREFIX.unpack_from(self.buffer, 0)
+        if version > FORMAT_VERSION:
+            raise ValueError(f"'{self.path}' uses format version {version}, newer than {FORMAT_VERSION}")
+        if size > len(self.buffer):
+            raise ValueError(f"'{self.path}' has a truncated header")
+        self.version = version
+        self.header_size = size
+
+        self.contigs = []
+        i = HEADER_PREFIX.size
+        for _ in range(n_contigs):
+            name_len = CONTIG_ENTRY.unpack_from(self.buffer, i)[0]
+            i += CONTIG_ENTRY.size
+            name = bytes(self.buffer[i:i + name_len]).decode('ascii')
+            i += name_len
+            length = CONTIG_LENGTH.unpack_from(self.buffer, i)[0]
+            i += CONTIG_LENGTH.size
+            self.contigs.append((name, length))
+
+        for _ in range(n_blocks):
+            kind, contig, codec, _, offset, block_size = BLOCK_ENTRY.unpack_from(self.buffer, i)
+            i += BLOCK_ENTRY.size
+            if offset + block_size > len(self.buffer):
+                raise ValueError(f"'{self.path}' is truncated: block {kind!r} ends past EOF")
+            self.blocks[(kind, contig)] = self.buffer[offset:offset + block_size]
+            self.codecs[(kind, contig)] = codec
+
+        self.ref_length = self.contigs[0][1] if self.contigs else 0
+
+    # Blocks of the first contig. They are looked up on access, so a
+    # compressed block is only decompressed once it is actually read.
+    @property
+    def reference(self):
+        return self._first_block(BLOCK_REFERENCE)
+
+    @property
+    def mask(self):
+        return self.mask_for(0) if self.contigs else b''
+
+    @property
+    def variants(self):
+        return self._first_block(BLOCK_VARIANTS)
+
+    @property
+    def meta(self):
+        return self._first_block(BLOCK_META)
+
+    def _first_block(self, kind):
+        block = self.block(kind)
+        return block if block is not None else b''
+
+    @property
+    def reference_digest(self):
+        digest = self.block(BLOCK_REFERENCE_DIGEST, GLOBAL_CONTIG)
+        return bytes(digest).hex() if digest is not None else None
+
+    def _attach_reference(self, reference_store):
+        digest = self.reference_digest
+        roots = [reference_store, default_reference_store()]
+        for root in roots:
+            if root and os.path.exists(reference_store_path(root, digest)):
+                break
+        else:
+            raise FileNotFoundError(f"'{self.path}' needs shared reference {digest}, not found in any reference store")
+
+        shared = HexContainer(reference_store_path(root, digest))
+        if shared.contigs != self.contigs:
+            shared.close()
+            raise ValueError(f"shared reference {digest} does not match the contigs of '{self.path}'")
+        self.shared_reference = shared
+        for contig in range(len(self.contigs)):
+            for kind in (BLOCK_REFERENCE, BLOCK_MASK, BLOCK_MASK_RUNS):
+                if (kind, contig) in shared.blocks:
+                    self.blocks[(kind, contig)] = shared.blocks[(kind, contig)]
+                    self.codecs[(kind, contig)] = shared.codecs[(kind, contig)]
+
+    def _read_legacy(self, ref_length):
+        self.version = 0
+        self.flags = 0
+        self.header_size = 0
+        self.ref_length = ref_length
+        self.contigs = [('', ref_length)] if ref_length else []
+
+        ref_size = (ref_length * 2 + 7) // 8
+        mask_size = (ref_length + 7) // 8
+        variant_start = ref_size + mask_size
+        if variant_start > len(self.buffer):
+            raise ValueError(f"'{self.path}' is shorter than a {ref_length} bp reference")
+
+        self.blocks[(BLOCK_REFERENCE, 0)] = self.buffer[:ref_size]
+        self.blocks[(BLOCK_MASK, 0)] = self.buffer[ref_size:variant_start]
+
+        # META bytes cannot occur inside the (AF, DP, GT) payload, so the last
+        # marker in the file is the real one
+        meta_idx = self._mmap.rfind(META_MARKER, variant_start)
+        if meta_idx == -1:
+            self.blocks[(BLOCK_VARIANTS, 0)] = self.buffer[variant_start:]
+            self.blocks[(BLOCK_META, 0)] = self.buffer[len(self.buffer):]
+        else:
+            meta_len = struct.unpack_from('>I', self.buffer, meta_idx + 4)[0]
+            meta_start = meta_idx + 8
+            self.blocks[(BLOCK_VARIANTS, 0)] = self.buffer[variant_start:meta_idx]
+            self.blocks[(BLOCK_META, 0)] = self.buffer[meta_start:meta_start + meta_len]
+
+    def contig_index(self, name):
+        for idx, (contig_name, _) in enumerate(self.contigs):
+            if contig_name == name:
+                return idx
+        raise KeyError(f"contig '{name}' not in '{self.path}'")
+
+    # Raw (decompressed) block data; compressed blocks are decompressed in
+    # full on first use
+    def block(self, kind, contig=0):
+        key = (kind, contig)
+        if self.codecs.get(key, CODEC_RAW) == CODEC_RAW:
+            return self.blocks.get(key)
+        if key not in self._decoded:
+            self._decoded[key] = self.compressed_block(kind, contig).tobytes()
+        return self._decoded[key]
+
+    # CompressedBlock for random access into a non-raw block, else None
+    def compressed_block(self, kind, contig=0):
+        key = (kind, contig)
+        if self.codecs.get(key, CODEC_RAW) == CODEC_RAW:
+            return None
+        if key not in self._compressed:
+            self._compressed[key] = CompressedBlock(self.blocks[key], self.codecs[key])
+        return self._compressed[key]
+
+    # Masked reference bases [start, end) of a contig as a uint8 ASCII array;
+    # a compressed reference block only has the chunks under the window decompressed
+    def reference_bases(self, contig, start, end):
+        contig = self._contig_id(contig)
+        mask = self.mask_for(contig)
+        compressed = self.compressed_block(BLOCK_REFERENCE, contig)
+        if compressed is None:
+            return decode_reference(self.block(BLOCK_REFERENCE, contig), mask, end - start, start)
+        first = start // 4
+        data = compressed.read(first, (end + 3) // 4)
+        bases = unpack_bases(data, end - start, start - 4 * first).copy()
+        return apply_mask(bases, mask, start)
+
+    # Reference base codes of a contig at positions (UNKNOWN_BASE where
+    # masked); all UNKNOWN_BASE when the reference is not available
+    def reference_codes(self, contig, positions):
+        contig = self._contig_id(contig)
+        reference = self.block(BLOCK_REFERENCE, contig)
+        if reference is None:
+            return np.full(len(positions), UNKNOWN_BASE, dtype=np.uint8)
+        return reference_codes(reference, self.mask_for(contig), positions)
+
+    # Sample names of a cohort file ([] for single-sample files)
+    @property
+    def samples(self):
+        block = self.block(BLOCK_SAMPLES, GLOBAL_CONTIG)
+        return unpack_names(block) if block is not None else []
+
+    def sample_index(self, name):
+        samples = self.samples
+        if name not in samples:
+            raise KeyError(f"sample '{name}' not in '{self.path}'")
+        return samples.index(name)
+
+    # GenotypeMatrix of a contig's variants (rows follow the VARS block), or
+    # None when the file has no cohort genotypes
+    def genotypes(self, contig=0):
+        block = self.block(BLOCK_GENOTYPES, self._contig_id(contig))
+        if block is None:
+            return None
+        return GenotypeMatrix(block, len(self.samples))
+
+    # A contig's N mask: MaskRuns for NRUN blocks, the raw bitmap for MASK blocks
+    def mask_for(self, contig=0):
+        runs = self.block(BLOCK_MASK_RUNS, contig)
+        if runs is not None:
+            return MaskRuns.from_block(runs)
+        mask = self.block(BLOCK_MASK, contig)
+        return mask if mask is not None else MaskRuns([], [])
+
+    def _contig_id(self, contig):
+        return contig if isinstance(contig, int) else self.contig_index(contig)
+
+    # VariantColumns of a contig stored in the column layout (VCOL), else None;
+    # parsed once per contig. SNP REF bases left out of the block are read
+    # back from the reference.
+    def variant_columns(self, contig=0):
+        contig = self._contig_id(contig)
+        if contig not in self._columns:
+            block = self.block(BLOCK_VARIANT_COLUMNS, contig)
+            self._columns[contig] = (VariantColumns(block, partial(self.reference_codes, contig))
+                                     if block is not None else None)
+        return self._columns[contig]
+
+    # MetaColumns of a contig's MCOL block, else None
+    def meta_columns(self, contig=0):
+        block = self.block(BLOCK_META_COLUMNS, self._contig_id(contig))
+        return MetaColumns(block) if block is not None else None
+
+    # Column view of a contig's metadata, one entry per variant record:
+    # MetaColumns for an MCOL block, else MetaTriples over the META block
+    # (empty when there is none). Either one filters with .select(query).
+    def metadata(self, contig=0):
+        columns = self.meta_columns(contig)
+        if columns is not None:
+            return columns
+        block = self.block(BLOCK_META, self._contig_id(contig))
+        return MetaTriples(block if block is not None else b'')
+
+    # Every variant of a contig as a VariantTable, from its VARS or VCOL block;
+    # strict=False stops at a bad VARS record instead of raising (see .error)
+    def variant_table(self, contig=0, strict=True):
+        contig = self._contig_id(contig)
+        columns = self.variant_columns(contig)
+        if columns is not None:
+            return columns.merged()
+        variants = self.block(BLOCK_VARIANTS, contig)
+        if variants is None:
+            return VariantTable()
+        return VariantTable.from_block(variants, strict=strict)
+
+    # VariantTable of records with start <= POS < end, located through the VIDX block;
+    # overlapping=True also returns deletions running into the region
+    def query(self, contig, start, end, overlapping=False):
+        contig = self._contig_id(contig)
+        columns = self.variant_columns(contig)
+        if columns is not None:
+            return columns.query(start, end, overlapping)
+        variants = self.compressed_block(BLOCK_VARIANTS, contig) or self.block(BLOCK_VARIANTS, contig)
+        if variants is None:
+            return VariantTable()
+        return query_records(variants, start, end, self.block(BLOCK_VARIANT_INDEX, contig), overlapping)
+
+    # Reference bases [start, end) (0-based, masked bases as 'N'). With
+    # apply_variants the sample's variants inside the window are spliced in
+    # (same semantics as full restoration), and a deletion starting before the
+    # window trims its leading bases.
+    def fetch(self, contig, start, end, apply_variants=True):
+        contig = self._contig_id(contig)
+        length = self.contigs[contig][1]
+        end = min(end, length)
+        if start < 0 or start > end:
+            raise ValueError(f"invalid region {start}-{end} for a {length} bp contig")
+
+        window = self.reference_bases(contig, start, end).tobytes()
+        if not apply_variants:
+            return window.decode('ascii')
+
+        # POS is 1-based: SNPs at POS end+1 edit base `end`, outside the window
+        hits = self.query(contig, start, end + 1, overlapping=True)
+        starts = hits.starts()
+        inside = starts >= start
+        variants = hits.filter(inside & (starts < end))
+        variants.pos -= start
+        overhang = int((hits.ends() - start)[~inside & (hits.vtype == VARIANT_DEL)].max(initial=0))
+        if overhang > 0:
+            trim = VariantTable([0], [VARIANT_DEL], [overhang], offset=[0], seq=hits.seq)
+            variants = VariantTable.concat([trim, variants])
+
+        read_ref = lambda s, e: window[s:e]
+        return b''.join(iter_patched_sequence(read_ref, len(window), variants)).decode('ascii')
+
+    def close(self):
+        if self.shared_reference is not None:
+            self.shared_reference.close()
+        if self._mmap.closed:
+            return
+        self._columns.clear()
+        self._decoded.clear()
+        self._compressed.clear()
+        views = list(self.blocks.values()) + [self.buffer]
+        for view in views:
+            if isinstance(view, memoryview):
+                view.release()
+        self.blocks.clear()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # a caller (or a traceback) still holds a view into the file; the
+            # mapping is unmapped once that last reference goes away
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Pickle by path so pool workers re-map the file themselves
+    def __reduce__(self):
+        ref_length = self.ref_length if self.version == 0 else None
+        store = None
+        if self.shared_reference is not None:
+            store = os.path.dirname(os.path.dirname(self.shared_reference.path))
+        return (self.__class__, (self.path, ref_length, store))
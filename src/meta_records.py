@@ -0,0 +1,434 @@
+import re
+import struct
+import numpy as np
+from variant_records import GT_HOM_REF, GT_HET, GT_MISSING, GT_HOM_ALT
+
+# --- META triples (META block) ---
+# One (AF, DP, GT) byte triple per variant record:
+#   AF × 255, DP capped at 255, GT code (GT_HOM_REF / GT_HET / GT_MISSING / GT_HOM_ALT)
+META_ENTRY_BYTES = 3
+
+def encode_af(val):
+    try:
+        return int(round(min(max(float(val), 0.0), 1.0) * 255))
+    except (TypeError, ValueError):
+        return 0
+
+def encode_dp(val):
+    try:
+        return min(max(int(val), 0), 255)
+    except (TypeError, ValueError):
+        return 0
+
+# GT string ('0|1', '1/2', '1', './.') → ([allele index, -1 for '.'], phased);
+# None when it is empty or malformed, or has more than two alleles
+def parse_gt(gt_str):
+    if not gt_str:
+        return None
+    calls = gt_str.replace('|', '/').split('/')
+    if len(calls) > 2 or not all(call == '.' or call.isdigit() for call in calls):
+        return None
+    return [int(call) if call != '.' else -1 for call in calls], '|' in gt_str
+
+# GT string → GT code. Any two different alleles (0/1, 1|0, 1/2) are
+# heterozygous, two copies of the same ALT allele (1/1, 2/2) homozygous
+# alternate; haploid calls count as homozygous. Missing or malformed → GT_MISSING.
+def encode_gt(gt_str):
+    parsed = parse_gt(gt_str)
+    if parsed is None or -1 in parsed[0]:
+        return GT_MISSING
+    alleles = parsed[0]
+    first, second = alleles if len(alleles) == 2 else alleles * 2
+    if first != second:
+        return GT_HET
+    return GT_HOM_REF if first == 0 else GT_HOM_ALT
+
+
+# --- META columns (MCOL block) ---
+# Optional richer alternative to the META triples: one column per field, each
+# value packed to a power-of-two width of 1 to 64 bits (MSB first below 8 bits,
+# big-endian above), so a record costs a few bytes and every field can be read
+# on its own:
+#   record count, field count ('>IB')
+#   per field: name ('4s'), bits per value, column bytes, extra bytes ('>4sBII')
+#   every field's column followed by its extra bytes, in field order
+# Readers skip fields they do not know. The fields written here:
+#   AF   AF × 255 (8 bits)
+#   DP   exact below DP_EXACT, then DP_STEPS codes per doubling, up to ~31,000 (8 bits)
+#   GT   first allele, second allele (all ones for '.'), phased bit, haploid bit (8 or 16 bits)
+#   ALT  1-based index, in the VCF ALT field, of the allele the variant record encodes
+#   QUAL half-precision float, NaN for '.', clipped to ±65504 (16 bits)
+#   FILT one bit per FILTER name, bit k for names[k]; the names (PASS included,
+#        FILTER_OTHER last) are the extra bytes, ';'-separated as in a VCF
+#        FILTER field
+META_COLUMNS_HEADER = struct.Struct('>IB')
+META_FIELD = struct.Struct('>4sBII')
+FIELD_AF = b'AF  '
+FIELD_DP = b'DP  '
+FIELD_GT = b'GT  '
+FIELD_ALT = b'ALT '
+FIELD_QUAL = b'QUAL'
+FIELD_FILTER = b'FILT'
+FIELD_WIDTHS = (1, 2, 4, 8, 16, 32, 64)
+
+DP_EXACT = 128
+DP_STEPS = 16
+
+# Largest finite half-precision float; QUAL beyond it (or ±inf) is clipped
+QUAL_MAX = 65504.0
+
+# FILTER names are bits of one 64-bit value: up to MAX_FILTER_NAMES names from
+# the header, then FILTER_OTHER for every name the header does not declare
+# (or declares past the first MAX_FILTER_NAMES)
+FILTER_OTHER = '*'
+MAX_FILTER_NAMES = 63
+
+# Phased / haploid flags in the low bits of a GT value
+GT_PHASED = 0b10
+GT_HAPLOID = 0b01
+
+# One record's fields while a contig section is collected. Rows are fixed
+# width, so a section spools like the META triples, and become columns once
+# the section is complete (encode_meta_columns).
+META_ROW = np.dtype([('af', 'u1'), ('dp', '>u4'), ('gt', '>i2', (2,)), ('phased', 'u1'), ('haploid', 'u1'),
+                     ('alt', '>u2'), ('qual', '>f4'), ('filter', '>u8')])
+META_ROW_STRUCT = struct.Struct('>BIhhBBHfQ')
+
+# Header FILTER names → the name table of an MCOL block (FILTER_OTHER
+# appended); names past the first MAX_FILTER_NAMES share the FILTER_OTHER bit
+def filter_table(names):
+    return list(names)[:MAX_FILTER_NAMES] + [FILTER_OTHER]
+
+# FILTER field → bit mask over filter_ids (name → bit, from filter_table);
+# '.' → 0, undeclared names → the FILTER_OTHER bit
+def filter_mask(filter_str, filter_ids):
+    if not filter_str or filter_str == '.':
+        return 0
+    mask = 0
+    for name in filter_str.split(';'):
+        mask |= 1 << filter_ids.get(name, filter_ids[FILTER_OTHER])
+    return mask
+
+# QUAL clipped to ±QUAL_MAX; NaN ('.') stays NaN
+def clip_qual(qual):
+    return qual if qual != qual else min(max(qual, -QUAL_MAX), QUAL_MAX)
+
+# One META_ROW for a variant record; gt_str None leaves GT missing (cohort
+# files keep genotypes in GTMX)
+def meta_row(af, dp, gt_str, alt_index, qual, filter_str, filter_ids):
+    parsed = parse_gt(gt_str) if gt_str is not None else None
+    alleles, phased = parsed if parsed is not None else ([-1, -1], False)
+    first, second = alleles if len(alleles) == 2 else (alleles[0], -1)
+    return META_ROW_STRUCT.pack(af, min(max(dp, 0), 0xFFFFFFFF), first, second, phased, len(alleles) == 1,
+                                alt_index, clip_qual(qual), filter_mask(filter_str, filter_ids))
+
+def decode_af(codes):
+    return np.asarray(codes) / 255
+
+def encode_dp_log(dp):
+    dp = np.asarray(dp, dtype=np.float64)
+    scaled = DP_EXACT + np.rint(DP_STEPS * np.log2(np.maximum(dp, DP_EXACT) / DP_EXACT))
+    return np.where(dp < DP_EXACT, np.maximum(dp, 0), np.minimum(scaled, 255)).astype(np.uint8)
+
+def decode_dp_log(codes):
+    codes = np.asarray(codes, dtype=np.float64)
+    return np.where(codes < DP_EXACT, codes, np.rint(DP_EXACT * 2 ** ((codes - DP_EXACT) / DP_STEPS))).astype(np.uint32)
+
+def decode_qual(codes):
+    return np.asarray(codes, dtype='>u2').view('>f2').astype(np.float32)
+
+# Smallest field width holding max_value
+def field_bits(max_value):
+    for bits in FIELD_WIDTHS:
+        if max_value < 1 << bits:
+            return bits
+    raise ValueError(f"{max_value} does not fit a META field")
+
+# Unsigned values → column bytes at `bits` per value
+def pack_field(values, bits):
+    values = np.asarray(values, dtype=np.uint64)
+    if bits >= 8:
+        return values.astype(f'>u{bits // 8}').tobytes()
+    per_byte = 8 // bits
+    padded = np.zeros(-(-len(values) // per_byte) * per_byte, dtype=np.uint8)
+    padded[:len(values)] = values
+    shifts = np.arange(8 - bits, -1, -bits, dtype=np.uint8)
+    return np.bitwise_or.reduce(padded.reshape(-1, per_byte) << shifts, axis=1).astype(np.uint8).tobytes()
+
+# Column bytes → count unsigned values; widths of 8 bits and up are zero-copy views
+def unpack_field(data, bits, count):
+    if bits >= 8:
+        return np.frombuffer(data, dtype=f'>u{bits // 8}', count=count)
+    per_byte = 8 // bits
+    packed = np.frombuffer(data, dtype=np.uint8, count=-(-count // per_byte))
+    shifts = np.arange(8 - bits, -1, -bits, dtype=np.uint8)
+    return ((packed[:, None] >> shifts) & ((1 << bits) - 1)).reshape(-1)[:count]
+
+# Value i of a column alone, without unpacking the others
+def unpack_value(data, bits, i):
+    if bits >= 8:
+        size = bits // 8
+        return int.from_bytes(data[i * size:(i + 1) * size], 'big')
+    return (data[i * bits // 8] >> (8 - bits - i * bits % 8)) & ((1 << bits) - 1)
+
+# META_ROW bytes of one section → MCOL block
+def encode_meta_columns(rows, filter_names):
+    rows = np.frombuffer(rows, dtype=META_ROW)
+    alleles = rows['gt'].astype(np.int64)
+    gt_bits = 8 if alleles.max(initial=0) < 7 else 16
+    allele_bits = (gt_bits - 2) // 2
+    missing = (1 << allele_bits) - 1
+    if alleles.max(initial=0) >= missing:
+        raise ValueError(f"allele index {alleles.max()} does not fit the GT field")
+    alleles = np.where(alleles < 0, missing, alleles)
+    gt = ((alleles[:, 0] << (allele_bits + 2)) | (alleles[:, 1] << 2)
+          | rows['phased'].astype(np.int64) * GT_PHASED | rows['haploid'].astype(np.int64) * GT_HAPLOID)
+    qual = np.clip(rows['qual'], -QUAL_MAX, QUAL_MAX).astype('>f2').view('>u2')
+
+    fields = [(FIELD_AF, 8, rows['af'], b''),
+              (FIELD_DP, 8, encode_dp_log(rows['dp']), b''),
+              (FIELD_GT, gt_bits, gt, b''),
+              (FIELD_ALT, field_bits(int(rows['alt'].max(initial=0))), rows['alt'], b''),
+              (FIELD_QUAL, 16, qual, b''),
+              (FIELD_FILTER, field_bits(int(rows['filter'].max(initial=0))), rows['filter'],
+               ';'.join(filter_names).encode('ascii'))]
+    table = [META_COLUMNS_HEADER.pack(len(rows), len(fields))]
+    data = []
+    for name, bits, values, extra in fields:
+        column = pack_field(values, bits)
+        table.append(META_FIELD.pack(name, bits, len(column), len(extra)))
+        data += [column, extra]
+    return b''.join(table + data)
+
+
+# --- Column views and filtering ---
+# MetaTriples (META) and MetaColumns (MCOL) read straight from the block:
+# columns are numpy views into it, decoded only when a property asks for
+# values. select('AF > 0.05 and GT == het') compares conditions on the stored
+# codes (through a truth table over every code a field can hold), ANDs them
+# and returns the matching variant indices, which line up with the contig's
+# variant table.
+QUERY_FIELDS = {'AF': FIELD_AF, 'DP': FIELD_DP, 'GT': FIELD_GT, 'ALT': FIELD_ALT, 'QUAL': FIELD_QUAL,
+                'FILTER': FIELD_FILTER}
+GT_NAMES = {'hom_ref': GT_HOM_REF, 'het': GT_HET, 'missing': GT_MISSING, 'hom_alt': GT_HOM_ALT}
+COMPARISONS = {'<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal,
+               '==': np.equal, '!=': np.not_equal}
+CONDITION = re.compile(r'^\s*(\w+)\s*(<=|>=|==|!=|<|>)\s*(\S+)\s*$')
+
+# 'AF > 0.05 and GT == het' → [('AF', '>', '0.05'), ('GT', '==', 'het')]
+def parse_query(query):
+    conditions = []
+    for part in re.split(r'\s+and\s+', query.strip(), flags=re.IGNORECASE):
+        m = CONDITION.match(part)
+        if m is None:
+            raise ValueError(f"cannot parse META condition '{part}'")
+        field, op, value = m.groups()
+        if field.upper() not in QUERY_FIELDS:
+            raise ValueError(f"unknown META field '{field}'")
+        conditions.append((field.upper(), op, value))
+    return conditions
+
+# Indices of the records of view (MetaTriples / MetaColumns) meeting every
+# condition; query is a string for parse_query or a list of (field, op, value)
+def select_records(view, query):
+    conditions = parse_query(query) if isinstance(query, str) else query
+    hits = np.ones(len(view), dtype=bool)
+    for field, op, value in conditions:
+        hits &= view.mask(field.upper(), op, value)
+    return np.flatnonzero(hits)
+
+# GT condition value: 'het', 'hom_alt', ... or the code itself
+def gt_code(value):
+    if isinstance(value, str) and value.lower() in GT_NAMES:
+        return GT_NAMES[value.lower()]
+    return int(value)
+
+# `decode(code) op value` for codes, through a truth table when the field is
+# at most 16 bits wide
+def compare_codes(codes, bits, decode, op, value):
+    compare = COMPARISONS[op]
+    if bits <= 16:
+        return compare(decode(np.arange(1 << bits)), float(value))[codes]
+    return compare(decode(codes), float(value))
+
+
+# Strided views over a META block of (AF, DP, GT) triples
+class MetaTriples:
+    def __init__(self, block):
+        self.block = block
+        count = len(block) // META_ENTRY_BYTES
+        self.rows = np.frombuffer(block, dtype=np.uint8,
+                                  count=count * META_ENTRY_BYTES).reshape(count, META_ENTRY_BYTES)
+
+    def __len__(self):
+        return len(self.rows)
+
+    # Same view over its own copy of the block
+    def copy(self):
+        return MetaTriples(bytes(self.block))
+
+    # Raw codes of a field (None if the triples do not have it)
+    def column(self, name):
+        k = {FIELD_AF: 0, FIELD_DP: 1, FIELD_GT: 2}.get(name)
+        return self.rows[:, k] if k is not None else None
+
+    @property
+    def af(self):
+        return decode_af(self.rows[:, 0])
+
+    @property
+    def dp(self):
+        return self.rows[:, 1]
+
+    def genotype_codes(self):
+        return self.rows[:, 2]
+
+    # Which records meet `field op value` (see select_records)
+    def mask(self, field, op, value):
+        if field == 'GT':
+            return COMPARISONS[op](self.rows[:, 2], gt_code(value))
+        if field == 'AF':
+            return compare_codes(self.rows[:, 0], 8, decode_af, op, value)
+        if field == 'DP':
+            return compare_codes(self.rows[:, 1], 8, lambda codes: codes, op, value)
+        raise ValueError(f"META triples have no {field} field")
+
+    def select(self, query):
+        return select_records(self, query)
+
+    def record(self, i):
+        af, dp, gt = self.rows[i].tolist()
+        return {'AF': af / 255, 'DP': dp, 'GT': gt}
+
+
+# GT field values → allele indices (× 2, -1 for '.'), phased and haploid flags
+def split_gt(gt, bits):
+    allele_bits = (bits - 2) // 2
+    missing = (1 << allele_bits) - 1
+    gt = np.asarray(gt, dtype=np.int64)
+    alleles = np.stack([gt >> (allele_bits + 2), (gt >> 2) & missing], axis=1)
+    alleles[alleles == missing] = -1
+    return alleles.astype(np.int16), (gt & GT_PHASED) != 0, (gt & GT_HAPLOID) != 0
+
+# GT field values and ALT indices → GT codes of that ALT allele
+def allele_genotype_codes(gt, bits, alt_index):
+    alleles, _, haploid = split_gt(gt, bits)
+    alleles[haploid, 1] = alleles[haploid, 0]
+    copies = (alleles == np.asarray(alt_index, dtype=np.int16)[:, None]).sum(axis=1)
+    codes = np.where(copies == 2, GT_HOM_ALT, np.where(copies == 1, GT_HET, GT_HOM_REF)).astype(np.uint8)
+    codes[(alleles < 0).any(axis=1)] = GT_MISSING
+    return codes
+
+
+# Read side of an MCOL block. fields maps each field name to (bits, column
+# bytes, extra bytes), all slices of the block; the properties decode one
+# field each, in bulk.
+class MetaColumns:
+    def __init__(self, block):
+        self.block = block
+        self.count, n_fields = META_COLUMNS_HEADER.unpack_from(block, 0)
+        i = META_COLUMNS_HEADER.size
+        entries = []
+        for _ in range(n_fields):
+            entries.append(META_FIELD.unpack_from(block, i))
+            i += META_FIELD.size
+        self.fields = {}
+        for name, bits, size, extra in entries:
+            if i + size + extra > len(block):
+                raise ValueError("Unexpected EOF while reading META columns.")
+            self.fields[name] = (bits, block[i:i + size], block[i + size:i + size + extra])
+            i += size + extra
+
+    def __len__(self):
+        return self.count
+
+    # Same view over its own copy of the block
+    def copy(self):
+        return MetaColumns(bytes(self.block))
+
+    # Raw values of a field (None if the block does not have it)
+    def column(self, name):
+        if name not in self.fields:
+            return None
+        bits, data, _ = self.fields[name]
+        return unpack_field(data, bits, self.count)
+
+    @property
+    def af(self):
+        return decode_af(self.column(FIELD_AF))
+
+    @property
+    def dp(self):
+        return decode_dp_log(self.column(FIELD_DP))
+
+    @property
+    def alt_index(self):
+        return self.column(FIELD_ALT)
+
+    @property
+    def qual(self):
+        return decode_qual(self.column(FIELD_QUAL))
+
+    # Allele indices (records × 2, -1 for '.'), phased and haploid flags
+    @property
+    def genotypes(self):
+        return split_gt(self.column(FIELD_GT), self.fields[FIELD_GT][0])
+
+    # GT codes of each record's own ALT allele, as in the META triples. With
+    # an 8-bit GT field they come from a table over every (GT, ALT) pair.
+    def genotype_codes(self):
+        gt_bits = self.fields[FIELD_GT][0]
+        alt_bits = self.fields[FIELD_ALT][0]
+        if gt_bits + alt_bits > 16:
+            return allele_genotype_codes(self.column(FIELD_GT), gt_bits, self.alt_index)
+        gt, alt = np.divmod(np.arange(1 << (gt_bits + alt_bits)), 1 << alt_bits)
+        table = allele_genotype_codes(gt, gt_bits, alt)
+        return table[(self.column(FIELD_GT).astype(np.int64) << alt_bits) | self.alt_index]
+
+    @property
+    def filter_names(self):
+        names = bytes(self.fields[FIELD_FILTER][2]).decode('ascii')
+        return names.split(';') if names else []
+
+    # FILTER bit masks (bit k = filter_names[k])
+    @property
+    def filter_masks(self):
+        return self.column(FIELD_FILTER)
+
+    # Which records meet `field op value` (see select_records). GT compares
+    # each record's genotype code; FILTER supports == / != a filter name.
+    def mask(self, field, op, value):
+        name = QUERY_FIELDS[field]
+        if name not in self.fields:
+            raise ValueError(f"META columns have no {field} field")
+        if field == 'GT':
+            return COMPARISONS[op](self.genotype_codes(), gt_code(value))
+        if field == 'FILTER':
+            if op not in ('==', '!='):
+                raise ValueError(f"FILTER only supports == and !=, not {op}")
+            names = self.filter_names
+            bit = np.uint64(1 << names.index(value)) if value in names else np.uint64(0)
+            hits = (self.filter_masks & bit) != 0
+            return hits if op == '==' else ~hits
+        decode = {FIELD_AF: decode_af, FIELD_DP: decode_dp_log, FIELD_QUAL: decode_qual,
+                  FIELD_ALT: lambda codes: codes}[name]
+        return compare_codes(self.column(name), self.fields[name][0], decode, op, value)
+
+    def select(self, query):
+        return select_records(self, query)
+
+    # Raw value of a field at record i (unpacks that row only)
+    def value(self, name, i):
+        bits, data, _ = self.fields[name]
+        return unpack_value(data, bits, range(self.count)[i])
+
+    # Record i as VCF-style strings and numbers; decodes row i only
+    def record(self, i):
+        alleles, phased, haploid = split_gt(np.array([self.value(FIELD_GT, i)]), self.fields[FIELD_GT][0])
+        calls = ['.' if a < 0 else str(a) for a in alleles[0][:1 if haploid[0] else 2]]
+        mask = self.value(FIELD_FILTER, i)
+        filters = [name for k, name in enumerate(self.filter_names) if mask >> k & 1]
+        qual = float(decode_qual(self.value(FIELD_QUAL, i)))
+        return {'AF': float(decode_af(self.value(FIELD_AF, i))), 'DP': int(decode_dp_log(self.value(FIELD_DP, i))),
+                'GT': ('|' if phased[0] else '/').join(calls), 'ALT': self.value(FIELD_ALT, i),
+                'QUAL': None if np.isnan(qual) else qual, 'FILTER': ';'.join(filters) or '.'}
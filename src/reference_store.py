@@ -0,0 +1,57 @@
+import hashlib
+import os
+from hex_container import (HexContainer, write_hex_file, reference_store_path, default_reference_store,
+                           BLOCK_REFERENCE, BLOCK_MASK_RUNS)
+
+# sha256 over the contig table and every contig's reference + N-run blocks
+def reference_digest(contigs, packed):
+    digest = hashlib.sha256()
+    for (name, length), (ref_block, mask_block) in zip(contigs, packed):
+        name = name.encode('ascii')
+        digest.update(len(name).to_bytes(2, 'big') + name + length.to_bytes(4, 'big'))
+        digest.update(ref_block)
+        digest.update(mask_block)
+    return digest.hexdigest()
+
+
+# Content-addressed directory of reference-only containers (REF + NRUN per
+# contig). Identical references hash to the same digest and are stored once;
+# sample files only keep the digest. Without root the default store is used,
+# the same one HexContainer falls back to.
+class ReferenceStore:
+    def __init__(self, root=None):
+        self.root = root or default_reference_store()
+
+    def path(self, digest):
+        return reference_store_path(self.root, digest)
+
+    def __contains__(self, digest):
+        return os.path.exists(self.path(digest))
+
+    # contigs: [(name, length)], packed: [(reference block, NRUN block)] → digest
+    def put(self, contigs, packed):
+        digest = reference_digest(contigs, packed)
+        if digest in self:
+            return digest
+
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        blocks = []
+        for contig, (ref_block, mask_block) in enumerate(packed):
+            blocks.append((BLOCK_REFERENCE, contig, ref_block))
+            blocks.append((BLOCK_MASK_RUNS, contig, mask_block))
+
+        # write under a private name first so concurrent writers never expose a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        write_hex_file(tmp_path, contigs, blocks)
+        os.replace(tmp_path, path)
+        return digest
+
+    def open(self, digest):
+        return HexContainer(self.path(digest))
+
+    # Re-hash a stored reference and compare with its name
+    def verify(self, digest):
+        with self.open(digest) as ref:
+            packed = [(ref.block(BLOCK_REFERENCE, c), ref.block(BLOCK_MASK_RUNS, c)) for c in range(len(ref.contigs))]
+            return reference_digest(ref.contigs, packed) == digest
@@ -1,5 +1,7 @@
 import os
 from Bio import SeqIO
+from twobit_codec import pack_reference, pack_reference_runs, MaskRuns
+from hex_container import write_hex_file, BLOCK_REFERENCE, BLOCK_MASK_RUNS
 
 # ACGT -> encoded as 2bits(when there is N, it is converted to 00) 
 def encode_base2bit(base):
@@ -10,52 +12,39 @@ def encode_base2bit(base):
         'T': 0b11
     }.get(base, 0b00)  
 
-# Convert FASTA → reference block + mask block 
+# Convert FASTA → reference block + mask block (chunked, table-driven packing)
 def encode_reference_and_mask(fasta_path):
-    record = next(SeqIO.parse(fasta_path, "fasta"))
-    seq = str(record.seq).upper()
-
-    bitstream = bytearray()
-    mask_bits = []
-
-    bits = 0
-    count = 0
-
-    for base in seq:
-        is_N = base not in 'ACGT'
-        mask_bits.append(1 if is_N else 0)
-
-        bits = (bits << 2) | encode_base2bit(base)
-        count += 1
-
-        if count % 4 == 0:
-            bitstream.append(bits & 0xFF)
-            bits = 0
-
-    if count % 4 != 0:
-        bits <<= 2 * (4 - (count % 4))  # padding
-        bitstream.append(bits & 0xFF)
-
-    # Compressing mask bit
-    mask_bytes = bytearray()
-    for i in range(0, len(mask_bits), 8):
-        chunk = mask_bits[i:i+8]
-        byte = 0
-        for bit in chunk:
-            byte = (byte << 1) | bit
-        byte <<= (8 - len(chunk))  # padding
-        mask_bytes.append(byte)
-
-    return bitstream, mask_bytes
-
-def write_reference_and_mask(output_path, ref_bytes, mask_bytes):
-    with open(output_path, 'wb') as f:
-        f.write(ref_bytes)
-        f.write(mask_bytes)
+    return encode_record(next(SeqIO.parse(fasta_path, "fasta")))
+
+def encode_record(record):
+    ref_bytes, mask_bytes = pack_reference(str(record.seq))
+    return bytearray(ref_bytes), bytearray(mask_bytes)
+
+# contig: (name, length in bases), recorded in the file header; the dense mask
+# is stored as N runs
+def write_reference_and_mask(output_path, ref_bytes, mask_bytes, contig):
+    runs = MaskRuns.from_bitmap(mask_bytes, contig[1]).to_bytes()
+    write_references(output_path, [(contig, ref_bytes, runs)])
+
+# Every record of a multi-record FASTA → [((name, length), ref bytes, N-run bytes)]
+def encode_all_records(fasta_path):
+    encoded = []
+    for record in SeqIO.parse(fasta_path, "fasta"):
+        ref_bytes, mask_runs = pack_reference_runs(str(record.seq))
+        encoded.append(((record.id, len(record.seq)), ref_bytes, mask_runs))
+    return encoded
+
+def write_references(output_path, encoded):
+    blocks = []
+    for idx, (_, ref_bytes, mask_runs) in enumerate(encoded):
+        blocks.append((BLOCK_REFERENCE, idx, ref_bytes))
+        blocks.append((BLOCK_MASK_RUNS, idx, mask_runs))
+    write_hex_file(output_path, [contig for contig, _, _ in encoded], blocks)
 
     print(f" Reference + Mask saved at: → {output_path}")
-    print(f" Reference bytes: {len(ref_bytes)}")
-    print(f" Mask bytes: {len(mask_bytes)}")
+    print(f" Contigs: {len(encoded)}")
+    print(f" Reference bytes: {sum(len(ref) for _, ref, _ in encoded)}")
+    print(f" Mask bytes: {sum(len(mask) for _, _, mask in encoded)}")
 
 
 if __name__ == '__main__':
@@ -67,5 +56,4 @@ if __name__ == '__main__':
 
     print(f"📂 FASTA location: {fasta_file}")
 
-    ref_bytes, mask_bytes = encode_reference_and_mask(fasta_file)
-    write_reference_and_mask(output_file, ref_bytes, mask_bytes)
+    write_references(output_file, encode_all_records(fasta_file))
@@ -0,0 +1,204 @@
+import numpy as np
+
+# Bases handled per packing step. Multiple of 8 so that neither a reference
+# byte (4 bases) nor a mask byte (8 bases) ever straddles two chunks.
+PACK_CHUNK_BASES = 1 << 22
+
+# ASCII byte -> 2-bit code (A=00, C=01, G=10, T=11, anything else -> 00)
+BASE_CODE_TABLE = np.zeros(256, dtype=np.uint8)
+for _code, _base in enumerate(b'ACGT'):
+    BASE_CODE_TABLE[_base] = _code
+    BASE_CODE_TABLE[_base | 0x20] = _code  # lowercase (soft-masked) bases
+
+# ASCII byte -> mask bit (1 for every non-ACGT base, i.e. N and IUPAC codes)
+MASK_BIT_TABLE = np.ones(256, dtype=np.uint8)
+MASK_BIT_TABLE[np.frombuffer(b'ACGTacgt', dtype=np.uint8)] = 0
+
+
+def _as_bases(chunk):
+    if isinstance(chunk, str):
+        chunk = chunk.encode('ascii')
+    return np.frombuffer(chunk, dtype=np.uint8)
+
+
+def _pack_codes(bases):
+    codes = BASE_CODE_TABLE[bases]
+    pad = -len(codes) % 4
+    if pad:
+        codes = np.concatenate([codes, np.zeros(pad, dtype=np.uint8)])
+    codes = codes.reshape(-1, 4)
+    ref_bytes = (codes[:, 0] << 6) | (codes[:, 1] << 4) | (codes[:, 2] << 2) | codes[:, 3]
+    return ref_bytes.tobytes()
+
+
+# Pack one chunk of ASCII bases → (2-bit reference bytes, 1-bit mask bytes)
+def pack_chunk(chunk):
+    bases = _as_bases(chunk)
+    # packbits is MSB-first and zero-pads the last byte, same as the bit loop did
+    mask_bytes = np.packbits(MASK_BIT_TABLE[bases])
+    return _pack_codes(bases), mask_bytes.tobytes()
+
+
+# Yield (reference, mask) byte chunks for a sequence, PACK_CHUNK_BASES at a time
+def iter_packed_chunks(seq, chunk_bases=PACK_CHUNK_BASES):
+    if chunk_bases % 8:
+        raise ValueError("chunk_bases must be a multiple of 8")
+    for start in range(0, len(seq), chunk_bases):
+        yield pack_chunk(seq[start:start + chunk_bases])
+
+
+# Whole-sequence packing; output is byte-identical to the old per-base loop
+def pack_reference(seq, chunk_bases=PACK_CHUNK_BASES):
+    ref_parts = []
+    mask_parts = []
+    for ref_bytes, mask_bytes in iter_packed_chunks(seq, chunk_bases):
+        ref_parts.append(ref_bytes)
+        mask_parts.append(mask_bytes)
+    return b''.join(ref_parts), b''.join(mask_parts)
+
+
+# Pack the region of a sequence that begins at base `start` (a multiple of 4)
+# → (2-bit reference bytes, MaskRuns in sequence coordinates). Regions packed
+# independently join with b''.join / MaskRuns.concat.
+def pack_region(chunk, start=0):
+    bases = _as_bases(chunk)
+    return _pack_codes(bases), MaskRuns.from_bits(MASK_BIT_TABLE[bases], start)
+
+
+# Whole-sequence packing with the mask as N runs → (2-bit reference bytes, NRUN block bytes)
+def pack_reference_runs(seq, chunk_bases=PACK_CHUNK_BASES):
+    ref_parts = []
+    run_parts = []
+    for start in range(0, len(seq), chunk_bases):
+        ref_bytes, runs = pack_region(seq[start:start + chunk_bases], start)
+        ref_parts.append(ref_bytes)
+        run_parts.append(runs)
+    return b''.join(ref_parts), MaskRuns.concat(run_parts).to_bytes()
+
+
+# --- Run-length mask (NRUN block) ---
+# N bases in assemblies sit in a few long runs (gaps, centromeres, telomeres),
+# so the mask is stored as sorted, non-overlapping (start, length) runs rather
+# than one bit per base.
+MASK_RUN_DTYPE = np.dtype([('start', '>u4'), ('length', '>u4')])
+
+class MaskRuns:
+    def __init__(self, starts, ends):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+
+    # Runs of set bits in a 0/1 array whose first element is base `offset`
+    @classmethod
+    def from_bits(cls, bits, offset=0):
+        edges = np.diff(np.concatenate(([0], bits.astype(np.int8), [0])))
+        return cls(np.flatnonzero(edges == 1) + offset, np.flatnonzero(edges == -1) + offset)
+
+    # Dense MASK block (1 bit per base) → runs
+    @classmethod
+    def from_bitmap(cls, mask, length):
+        bits = np.unpackbits(np.frombuffer(mask, dtype=np.uint8))[:length]
+        return cls.from_bits(bits)
+
+    @classmethod
+    def from_block(cls, block):
+        runs = np.frombuffer(block, dtype=MASK_RUN_DTYPE)
+        starts = runs['start'].astype(np.int64)
+        return cls(starts, starts + runs['length'])
+
+    # Join position-ordered pieces, merging runs that touch across a boundary
+    @classmethod
+    def concat(cls, pieces):
+        starts = np.concatenate([p.starts for p in pieces]) if pieces else np.zeros(0, np.int64)
+        ends = np.concatenate([p.ends for p in pieces]) if pieces else np.zeros(0, np.int64)
+        if len(starts) > 1:
+            keep = starts[1:] != ends[:-1]
+            starts = starts[np.concatenate(([True], keep))]
+            ends = ends[np.concatenate((keep, [True]))]
+        return cls(starts, ends)
+
+    def to_bytes(self):
+        runs = np.empty(len(self.starts), dtype=MASK_RUN_DTYPE)
+        runs['start'] = self.starts
+        runs['length'] = self.ends - self.starts
+        return runs.tobytes()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __contains__(self, pos):
+        k = int(np.searchsorted(self.starts, pos, side='right')) - 1
+        return k >= 0 and pos < self.ends[k]
+
+    # Which of positions (any order) fall inside a run
+    def covers(self, positions):
+        if not len(self.starts):
+            return np.zeros(len(positions), dtype=bool)
+        k = np.searchsorted(self.starts, positions, side='right') - 1
+        return (k >= 0) & (positions < self.ends[np.maximum(k, 0)])
+
+    # Paint 'N' over the runs overlapping bases[0:] = [start, start + len(bases))
+    def paint(self, bases, start=0):
+        end = start + len(bases)
+        lo = int(np.searchsorted(self.ends, start, side='right'))
+        hi = int(np.searchsorted(self.starts, end, side='left'))
+        for run_start, run_end in zip(self.starts[lo:hi], self.ends[lo:hi]):
+            bases[max(run_start, start) - start:min(run_end, end) - start] = N_BASE
+        return bases
+
+
+# Packed byte -> its 4 ASCII bases, e.g. 0b00011011 -> b'ACGT'
+DECODE_TABLE = np.array(
+    [[b'ACGT'[(byte >> shift) & 0b11] for shift in (6, 4, 2, 0)] for byte in range(256)],
+    dtype=np.uint8,
+)
+
+N_BASE = ord('N')
+N_CODE = 4  # base code of a masked base next to the 2-bit A/C/G/T codes
+
+
+# Decode bases [start, start + length) of a 2-bit stream → uint8 array of ASCII
+def unpack_bases(data, length, start=0):
+    first_byte = start // 4
+    last_byte = (start + length + 3) // 4
+    packed = np.frombuffer(data, dtype=np.uint8, count=last_byte - first_byte, offset=first_byte)
+    bases = DECODE_TABLE[packed].reshape(-1)
+    skip = start % 4
+    return bases[skip:skip + length]
+
+
+# Paint 'N' over every masked base (bases is modified in place). mask is
+# either a MaskRuns or a dense 1-bit-per-base MASK block.
+def apply_mask(bases, mask, start=0):
+    if isinstance(mask, MaskRuns):
+        return mask.paint(bases, start)
+    first_byte = start // 8
+    last_byte = (start + len(bases) + 7) // 8
+    packed = np.frombuffer(mask, dtype=np.uint8, count=last_byte - first_byte, offset=first_byte)
+    skip = start % 8
+    bits = np.unpackbits(packed)[skip:skip + len(bases)]
+    bases[bits.view(bool)] = N_BASE
+    return bases
+
+
+# Reference + mask blocks → masked ASCII sequence (uint8 array)
+def decode_reference(ref_bytes, mask_bytes, length, start=0):
+    bases = unpack_bases(ref_bytes, length, start).copy()
+    return apply_mask(bases, mask_bytes, start)
+
+
+# Base codes (0-3, N_CODE where masked or outside the reference) at 0-based
+# positions, in any order, without decoding the bases in between
+def reference_codes(ref_bytes, mask_bytes, positions):
+    positions = np.asarray(positions, dtype=np.int64)
+    packed = np.frombuffer(ref_bytes, dtype=np.uint8)
+    inside = (positions >= 0) & (positions < 4 * len(packed))
+    at = np.where(inside, positions, 0)
+    codes = (packed[at >> 2] >> (6 - 2 * (at & 3))) & 0b11
+    if isinstance(mask_bytes, MaskRuns):
+        masked = mask_bytes.covers(at)
+    else:
+        bits = np.frombuffer(mask_bytes, dtype=np.uint8)
+        masked = np.zeros(len(at), dtype=bool)
+        has_bit = (at >> 3) < len(bits)
+        masked[has_bit] = (bits[at[has_bit] >> 3] >> (7 - (at[has_bit] & 7))) & 1
+    return np.where(inside & ~masked, codes, N_CODE).astype(np.uint8)
@@ -0,0 +1,866 @@
+import struct
+from itertools import groupby
+import numpy as np
+from block_codec import CompressedBlock
+from twobit_codec import unpack_bases
+
+BASE_TABLE = ['A', 'C', 'G', 'T']
+BASE_CODES = {base: code for code, base in enumerate(BASE_TABLE)}
+
+VARIANT_SNP = 0x00
+VARIANT_INS = 0x01
+VARIANT_DEL = 0x02
+
+# --- Record layout ---
+#   SNP      : type (1B), POS (4B), REF (1B), ALT (1B)
+#   INS / DEL: type (1B), POS (4B), LEN (LEB128, 1-5B), 2-bit sequence ((LEN*2+7)//8 B)
+# Every writer builds indel records with indel_record, so payloads are exactly
+# as long as the sequence needs, first base in the top bits of the first byte.
+# LEN takes one byte up to 127 bp and has no practical upper limit.
+INDEL_HEADER = struct.Struct('>BI')
+LENGTH_VARINT_BYTES = 5  # longest LEN varint (32 bits)
+
+# 2-bit payload of indel bases (anything but ACGT packs as A)
+def pack_indel_bases(seq):
+    bits = 0
+    for base in seq:
+        bits = bits << 2 | BASE_CODES.get(base, 0)
+    return (bits << 2 * (-len(seq) % 4)).to_bytes((len(seq) + 3) // 4, 'big')
+
+# One unsigned integer → LEB128 bytes
+def varint_bytes(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+# Type, POS and LEN of an INS/DEL record; the 2-bit payload follows
+def indel_header(vtype, pos, length):
+    return INDEL_HEADER.pack(vtype, pos) + varint_bytes(length)
+
+# One INS/DEL record
+def indel_record(vtype, pos, seq):
+    return indel_header(vtype, pos, len(seq)) + pack_indel_bases(seq)
+
+# Decode the record starting at buf[i] → ((pos, type, LEN, REF, ALT, payload
+# offset), offset of the next record). LEN is 1 for SNPs; REF/ALT are base
+# codes (UNKNOWN_BASE for indels); the payload offset locates an indel's 2-bit
+# sequence in buf. Raises ValueError on an unknown type tag or a truncated record.
+def decode_fields(buf, i):
+    n = len(buf)
+    vtype = buf[i]
+    if vtype not in (VARIANT_SNP, VARIANT_INS, VARIANT_DEL):
+        raise ValueError(f"Unknown variant type: {vtype:#x}")
+    if i + 5 > n:
+        raise ValueError("Unexpected EOF while reading position.")
+    pos = struct.unpack_from('>I', buf, i + 1)[0]
+    i += 5
+
+    if vtype == VARIANT_SNP:
+        if i + 2 > n:
+            raise ValueError("Unexpected EOF while reading SNP.")
+        return (pos, vtype, 1, min(buf[i], UNKNOWN_BASE), buf[i + 1] & 0b11, 0), i + 2
+
+    length = 0
+    for k in range(LENGTH_VARINT_BYTES):
+        if i + k >= n:
+            raise ValueError("Unexpected EOF while reading length.")
+        length |= (buf[i + k] & 0x7f) << 7 * k
+        if buf[i + k] < 0x80:
+            break
+    else:
+        raise ValueError(f"Length longer than {LENGTH_VARINT_BYTES} varint bytes.")
+    seq_len = (length * 2 + 7) // 8
+    i += k + 1
+    if i + seq_len > n:
+        raise ValueError("Unexpected EOF while reading sequence.")
+    return (pos, vtype, length, UNKNOWN_BASE, UNKNOWN_BASE, i), i + seq_len
+
+# Decode the record starting at buf[i] → (record dict, offset of the next record)
+def decode_record(buf, i):
+    (pos, vtype, length, _, alt, offset), next_i = decode_fields(buf, i)
+    if vtype == VARIANT_SNP:
+        return {'type': 'snp', 'pos': pos, 'alt': BASE_TABLE[alt]}, next_i
+    if vtype == VARIANT_INS:
+        ins_seq = unpack_bases(buf, length, offset * 4).tobytes().decode('ascii')
+        return {'type': 'ins', 'pos': pos, 'alt': ins_seq}, next_i
+    return {'type': 'del', 'pos': pos, 'len': length}, next_i
+
+# Yield (offset, record) from buf[start:] until the end of the buffer
+def iter_records(buf, start=0):
+    i = start
+    while i < len(buf):
+        record, next_i = decode_record(buf, i)
+        yield i, record
+        i = next_i
+
+
+# --- Bulk decoding ---
+# Records are variable-length, so where one record starts depends on the one
+# before it. Per DECODE_CHUNK_BYTES window, the size a record would have is
+# computed for every byte at once; the chain of record starts from the first
+# one is then found by pointer doubling (after k rounds every start up to 2^k
+# records ahead is known), and every field is gathered for all records of the
+# chunk in one go. No per-record Python code runs.
+DECODE_CHUNK_BYTES = 1 << 16
+_FIELD_BYTES = np.arange(1, 7)
+
+# LEB128 varints starting at every one of head[at:at + m] → (values, byte
+# counts); the count is 0 where a varint runs past LENGTH_VARINT_BYTES
+def _scan_varints(head, at, m):
+    values = np.zeros(m, dtype=np.int64)
+    sizes = np.zeros(m, dtype=np.int64)
+    more = np.ones(m, dtype=bool)
+    for k in range(LENGTH_VARINT_BYTES):
+        byte = head[at + k:at + k + m]
+        values |= np.where(more, (byte & 0x7f).astype(np.int64) << (7 * k), 0)
+        sizes += more
+        more &= byte >= 0x80
+    return values, np.where(more, 0, sizes)
+
+# Record starts in data[i:] up to DECODE_CHUNK_BYTES further → (starts,
+# offset after the last whole record, True if it stopped at a bad record,
+# LEN and payload offset (from the record start) of every record)
+def _scan_chunk(data, i):
+    n = len(data)
+    stop = min(i + DECODE_CHUNK_BYTES, n)
+    m = stop - i
+    pad = INDEL_HEADER.size + LENGTH_VARINT_BYTES
+    head = data[i:stop + pad]
+    if len(head) < m + pad:
+        head = np.concatenate([head, np.zeros(m + pad - len(head), dtype=np.uint8)])
+    tags = head[:m]
+    lengths, length_bytes = _scan_varints(head, INDEL_HEADER.size, m)
+    payload = INDEL_HEADER.size + length_bytes
+    indel = (tags == VARIANT_INS) | (tags == VARIANT_DEL)
+    sizes = np.where(tags == VARIANT_SNP, 7, np.where(indel & (length_bytes > 0), payload + (lengths * 2 + 7) // 8, 0))
+    ends = np.arange(m) + sizes
+    valid = (sizes > 0) & (ends <= n - i)
+
+    # jump[j]: next record start after a record at j; m once the chain leaves the window
+    jump = np.append(np.where(valid & (ends < m), ends, m), m)
+    chain = np.zeros(1, dtype=np.int64)
+    while True:
+        ahead = jump[chain]
+        ahead = ahead[ahead < m]
+        if not len(ahead):
+            break
+        chain = np.concatenate([chain, ahead])
+        jump = jump[jump]
+    chain.sort()
+
+    last = chain[-1]
+    if not valid[last]:
+        chain = chain[:-1]
+        return chain + i, i + last, True, lengths[chain], payload[chain]
+    return chain + i, i + ends[last], False, lengths[chain], payload[chain]
+
+# Fields of the records starting at each of starts, given the LEN and payload
+# offset _scan_chunk found for them → (pos, vtype, length, ref, alt, payload offset)
+def _gather_fields(data, starts, lengths, payload):
+    starts = np.asarray(starts, dtype=np.int64)
+    vtype = data[starts]
+    # a short indel record at the end of data can end before the SNP fields
+    fields = data.take(starts[:, None] + _FIELD_BYTES, mode='clip').astype(np.uint32)
+    pos = (fields[:, 0] << 24) | (fields[:, 1] << 16) | (fields[:, 2] << 8) | fields[:, 3]
+    snp = vtype == VARIANT_SNP
+    length = np.where(snp, 1, lengths)
+    ref = np.where(snp, np.minimum(fields[:, 4], UNKNOWN_BASE), UNKNOWN_BASE)
+    alt = np.where(snp, fields[:, 5] & 0b11, UNKNOWN_BASE)
+    offset = np.where(snp, 0, starts + payload)
+    return pos, vtype, length, ref, alt, offset
+
+# Decode buf[start:stop] in bulk → (record offsets, (pos, vtype, length, ref,
+# alt, payload offset) columns, ValueError or None); stop must be a record
+# boundary. With end_pos, stops at the first record with POS >= end_pos.
+# Decoding stops at the first bad record; the error is the one decode_record
+# would raise there.
+def scan_block(buf, start=0, end_pos=None, stop=None):
+    data = np.frombuffer(buf, dtype=np.uint8)[:stop]
+    pieces = []
+    error = None
+    i = start
+    while i < len(data):
+        starts, i, bad, lengths, payload = _scan_chunk(data, i)
+        piece = (starts, _gather_fields(data, starts, lengths, payload))
+        if end_pos is not None:
+            past = np.flatnonzero(piece[1][0] >= end_pos)
+            if len(past):
+                k = past[0]
+                pieces.append((piece[0][:k], tuple(column[:k] for column in piece[1])))
+                break
+        pieces.append(piece)
+        if bad:
+            try:
+                decode_fields(buf, i)
+            except ValueError as e:
+                error = e
+            break
+
+    if not pieces:
+        return np.zeros(0, dtype=np.int64), _gather_fields(data, [], [], []), error
+    offsets = np.concatenate([offsets for offsets, _ in pieces])
+    columns = tuple(np.concatenate(column) for column in zip(*(fields for _, fields in pieces)))
+    return offsets, columns, error
+
+
+# --- Variant table ---
+# Struct-of-arrays view of many records: one typed column per field instead of
+# one dict per record. pos (uint32), vtype (uint8, VARIANT_*), length (uint32,
+# 1 for SNPs), ref/alt (uint8 SNP base codes, UNKNOWN_BASE when absent) and
+# offset (uint64) of every indel's 2-bit payload in the shared seq buffer. A
+# table decoded from a variant block uses the block itself as seq, so indel
+# sequences are never copied; take/filter/sorted share it as well.
+TYPE_NAMES = {VARIANT_SNP: 'snp', VARIANT_INS: 'ins', VARIANT_DEL: 'del'}
+TYPE_CODES = {name: code for code, name in TYPE_NAMES.items()}
+UNKNOWN_BASE = 4
+SNP_BASES = [b'A', b'C', b'G', b'T', b'N']
+
+class VariantTable:
+    def __init__(self, pos=(), vtype=(), length=(), ref=None, alt=None, offset=None, seq=b''):
+        self.pos = np.asarray(pos, dtype=np.uint32)
+        n = len(self.pos)
+        self.vtype = np.asarray(vtype, dtype=np.uint8)
+        self.length = np.asarray(length, dtype=np.uint32)
+        self.ref = np.full(n, UNKNOWN_BASE, dtype=np.uint8) if ref is None else np.asarray(ref, dtype=np.uint8)
+        self.alt = np.full(n, UNKNOWN_BASE, dtype=np.uint8) if alt is None else np.asarray(alt, dtype=np.uint8)
+        self.offset = np.zeros(n, dtype=np.uint64) if offset is None else np.asarray(offset, dtype=np.uint64)
+        self.seq = seq
+        self.error = None  # why from_block(strict=False) stopped early, if it did
+
+    def __len__(self):
+        return len(self.pos)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.record(i)
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in (self.pos, self.vtype, self.length, self.ref, self.alt, self.offset))
+
+    # Record dicts ({'type', 'pos', 'alt'} or {'type': 'del', 'pos', 'len'};
+    # optional 'ref' for SNPs and 'seq' for the deleted bases) → table
+    @classmethod
+    def from_records(cls, records):
+        pos, vtype, length, ref, alt, offset = [], [], [], [], [], []
+        seq = bytearray()
+        for record in records:
+            code = TYPE_CODES[record['type']]
+            pos.append(record['pos'])
+            vtype.append(code)
+            if code == VARIANT_SNP:
+                length.append(1)
+                ref.append(BASE_CODES.get(record.get('ref'), UNKNOWN_BASE))
+                alt.append(BASE_CODES.get(record['alt'], UNKNOWN_BASE))
+                offset.append(0)
+                continue
+            bases = record['alt'] if code == VARIANT_INS else record.get('seq', '')
+            n = len(bases) if code == VARIANT_INS else record['len']
+            length.append(n)
+            ref.append(UNKNOWN_BASE)
+            alt.append(UNKNOWN_BASE)
+            offset.append(len(seq))
+            seq += pack_indel_bases(bases) if bases else bytes((n * 2 + 7) // 8)
+        return cls(pos, vtype, length, ref, alt, offset, bytes(seq))
+
+    # Decode a variant block from byte offset start (up to stop) in bulk (see scan_block);
+    # with end_pos, stop at the first record with POS >= end_pos. strict=False
+    # stops at the first bad record instead of raising and keeps the reason in .error.
+    @classmethod
+    def from_block(cls, buf, start=0, end_pos=None, strict=True, stop=None):
+        _, columns, error = scan_block(buf, start, end_pos, stop)
+        if error is not None and strict:
+            raise error
+        table = cls(*columns, seq=buf)
+        table.error = error
+        return table
+
+    # Tables → one table; their seq buffers are joined unless they all share one
+    @classmethod
+    def concat(cls, tables):
+        tables = list(tables)
+        if not tables:
+            return cls()
+        seq = tables[0].seq
+        offsets = [t.offset for t in tables]
+        if any(t.seq is not seq for t in tables):
+            base = 0
+            for k, t in enumerate(tables):
+                offsets[k] = t.offset + np.uint64(base)
+                base += len(t.seq)
+            seq = b''.join(bytes(t.seq) for t in tables)
+        return cls(*(np.concatenate([getattr(t, name) for t in tables])
+                     for name in ('pos', 'vtype', 'length', 'ref', 'alt')),
+                   np.concatenate(offsets), seq)
+
+    # Same rows owning their data: seq becomes bytes, so the table outlives the
+    # file it was decoded from (see HexContainer)
+    def copy(self):
+        table = VariantTable(self.pos.copy(), self.vtype.copy(), self.length.copy(), self.ref.copy(),
+                             self.alt.copy(), self.offset.copy(), bytes(self.seq))
+        table.error = self.error
+        return table
+
+    # Rows by index array, sharing seq
+    def take(self, indices):
+        return VariantTable(self.pos[indices], self.vtype[indices], self.length[indices], self.ref[indices],
+                            self.alt[indices], self.offset[indices], self.seq)
+
+    def filter(self, mask):
+        return self.take(np.flatnonzero(mask))
+
+    # Stable sort by position: same-position records keep their order
+    def sorted(self):
+        return self.take(np.argsort(self.pos, kind='stable'))
+
+    # Only the last record at every position, sorted by position
+    def last_per_position(self):
+        order = np.argsort(self.pos, kind='stable')
+        pos = self.pos[order]
+        return self.take(order[np.append(pos[1:] != pos[:-1], True)])
+
+    # 0-based reference index every record edits at: POS is 1-based, so a SNP
+    # replaces base POS-1, while an indel keeps its anchor base POS-1 and
+    # inserts or deletes from index POS on
+    def starts(self):
+        pos = self.pos.astype(np.int64)
+        return np.where(self.vtype == VARIANT_SNP, pos - 1, pos)
+
+    # Last base (exclusive) every record touches on the reference
+    def ends(self):
+        pos = self.pos.astype(np.int64)
+        return np.where(self.vtype == VARIANT_DEL, pos + self.length, pos + 1)
+
+    # ASCII bases of row i: the ALT base of a SNP, the inserted or deleted bases of an indel
+    def bases(self, i):
+        if self.vtype[i] == VARIANT_SNP:
+            return SNP_BASES[self.alt[i]]
+        return unpack_bases(self.seq, int(self.length[i]), int(self.offset[i]) * 4).tobytes()
+
+    def record(self, i):
+        vtype = int(self.vtype[i])
+        pos = int(self.pos[i])
+        if vtype == VARIANT_DEL:
+            return {'type': 'del', 'pos': pos, 'len': int(self.length[i])}
+        return {'type': TYPE_NAMES[vtype], 'pos': pos, 'alt': self.bases(i).decode('ascii')}
+
+    # Row i in the variant block layout
+    def record_bytes(self, i):
+        vtype = int(self.vtype[i])
+        pos = int(self.pos[i])
+        if vtype == VARIANT_SNP:
+            return struct.pack('>BIBB', vtype, pos, int(self.ref[i]) & 0b11, int(self.alt[i]) & 0b11)
+        length = int(self.length[i])
+        offset = int(self.offset[i])
+        return indel_header(vtype, pos, length) + bytes(self.seq[offset:offset + (length * 2 + 7) // 8])
+
+    def to_block(self):
+        return b''.join(self.record_bytes(i) for i in range(len(self)))
+
+# A VariantTable, or any iterable of record dicts
+def as_variant_table(variants):
+    if isinstance(variants, VariantTable):
+        return variants
+    return VariantTable.from_records(variants)
+
+
+# --- Sparse position index (VIDX block) ---
+# Every INDEX_STRIDE-th record contributes a (POS, byte offset, reach) entry,
+# so a region lookup is a binary search plus decoding at most one stride of
+# records before the first hit. reach is the furthest base touched by any
+# record up to the end of that stride (POS + LEN for deletions); it never
+# decreases, so the first stride that can overlap a position is also one
+# binary search away. Only position-sorted blocks get an index.
+INDEX_STRIDE = 64
+INDEX_ENTRY = struct.Struct('>IQI')
+INDEX_DTYPE = np.dtype([('pos', '>u4'), ('offset', '>u8'), ('reach', '>u4')])
+
+# Last base (exclusive) a record touches on the reference
+def record_end(record):
+    if record['type'] == 'del':
+        return record['pos'] + record['len']
+    return record['pos'] + 1
+
+class VariantIndexBuilder:
+    def __init__(self, stride=INDEX_STRIDE):
+        self.stride = stride
+        self.count = 0
+        self.last_pos = 0
+        self.reach = 0
+        self.sorted = True
+        self.entries = []
+
+    # Call once per record, in block order, with the record's byte offset;
+    # end is POS + LEN for deletions
+    def add(self, pos, offset, end=None):
+        if pos < self.last_pos:
+            self.sorted = False
+        self.reach = max(self.reach, end if end is not None else pos + 1)
+        if self.count % self.stride == 0:
+            self.entries.append([pos, offset, self.reach])
+        else:
+            self.entries[-1][2] = self.reach
+        self.last_pos = pos
+        self.count += 1
+
+    # Empty when the records were not position-sorted
+    def to_bytes(self):
+        if not self.sorted:
+            return b''
+        return b''.join(INDEX_ENTRY.pack(*entry) for entry in self.entries)
+
+# (POS, offset, reach) entry of every stride-th record; reach is the running
+# maximum of ends up to the stride's last record, as VariantIndexBuilder keeps it
+def index_entries(pos, ends, offsets, stride=INDEX_STRIDE):
+    reach = np.maximum.accumulate(ends) if len(ends) else ends
+    first = np.arange(0, len(pos), stride)
+    entries = np.empty(len(first), dtype=INDEX_DTYPE)
+    entries['pos'] = pos[first]
+    entries['offset'] = offsets[first]
+    entries['reach'] = reach[np.minimum(first + stride, len(pos)) - 1]
+    return entries
+
+# Index an already written variant block; same entries as VariantIndexBuilder
+def build_variant_index(buf, stride=INDEX_STRIDE):
+    offsets, (pos, vtype, length, *_), error = scan_block(buf)
+    if error is not None:
+        raise error
+    if np.any(pos[1:] < pos[:-1]):
+        return b''
+    return index_entries(pos, np.where(vtype == VARIANT_DEL, pos + length, pos + 1), offsets, stride).tobytes()
+
+# Zero-copy view of a VIDX block as a structured array of (pos, offset, reach)
+def read_variant_index(index_block):
+    return np.frombuffer(index_block, dtype=INDEX_DTYPE)
+
+# Records with start <= POS < end, as a VariantTable. With overlapping=True,
+# deletions that start before the region but run into it are included too.
+# With an index, only the strides that can hold hits are decoded; without one
+# the whole block is scanned. variant_block may be a CompressedBlock, in which
+# case only the chunks under those strides are decompressed.
+def query_records(variant_block, start, end, index_block=None, overlapping=False):
+    compressed = isinstance(variant_block, CompressedBlock)
+    first = 0
+    stop = None
+    indexed = index_block is not None and len(index_block) > 0
+    if indexed:
+        index = read_variant_index(index_block)
+        k_end = int(np.searchsorted(index['pos'], end, side='left'))
+        if k_end < len(index):
+            stop = int(index['offset'][k_end])
+        if overlapping:
+            k = int(np.searchsorted(index['reach'], start, side='right'))
+        else:
+            k = int(np.searchsorted(index['pos'], start, side='left')) - 1
+        if 0 <= k < len(index):
+            first = int(index['offset'][k])
+        elif k >= len(index):
+            return VariantTable(seq=b'' if compressed else variant_block)
+
+    if compressed:
+        variant_block = variant_block.read(first, len(variant_block) if stop is None else stop)
+        first, stop = 0, None
+    table = VariantTable.from_block(variant_block, first, end if indexed else None, stop=stop)
+    return select_region(table, start, end, overlapping)
+
+# Rows of table with start <= POS < end (plus deletions running into the
+# region with overlapping=True)
+def select_region(table, start, end, overlapping=False):
+    hits = table.pos >= start
+    if overlapping:
+        hits |= table.ends() > start
+    return table.filter(hits & (table.pos < end))
+
+
+# --- Column layout (VCOL block) ---
+# Optional alternative to the VARS record stream: records are split by type
+# into separate columns, each kept in record order, and a 2-bit type stream
+# records how they interleave. Positions are stored once, in record order, as
+# zigzag deltas from the previous record in LEB128 varints, with a checkpoint
+# (absolute POS, stream offset, reach as in VIDX) every INDEX_STRIDE records:
+#   SNP, INS and DEL counts, flags ('>IIIB')
+#   type of every record in record order, 2 bits each, MSB first
+#   checkpoints (INDEX_DTYPE) × ceil(records / INDEX_STRIDE)
+#   position stream length ('>I'), position stream
+#   SNP: REF (u1) × n, ALT (u1) × n
+#        or, with COLUMNS_REFERENCE_SNPS, only ALT at 2 bits each, 4 per byte
+#   INS: LEN stream length ('>I'), LEN (LEB128) × n, 2-bit payloads ((LEN*2+7)//8 B each)
+#   DEL: LEN stream length, LEN × n, payloads
+# Every column is a single frombuffer/gather, with no per-record branching,
+# and a region query only decodes the positions between two checkpoints.
+# SNP REF bases repeat the reference, so encode(table, reference) leaves them
+# out and the reader looks them up again (a SNP then costs its position plus
+# 4 bits: type and ALT). POS is the 1-based VCF POS, so REF is the reference
+# base at 0-based POS - 1.
+COLUMN_HEADER = struct.Struct('>IIIB')
+COLUMN_STREAM_LENGTH = struct.Struct('>I')
+COLUMNS_SORTED = 0x01  # positions never decrease, so checkpoints can be searched
+COLUMNS_REFERENCE_SNPS = 0x02  # SNP REF comes from the reference, ALT is 2-bit packed
+
+# Packed byte of the type stream / 2-bit ALT column → its 4 codes, MSB first
+COLUMN_CODE_TABLE = np.array(
+    [[(byte >> shift) & 0b11 for shift in (6, 4, 2, 0)] for byte in range(256)],
+    dtype=np.uint8,
+)
+
+# 2-bit codes (record types, SNP ALT bases) → bytes, four per byte, MSB first
+def pack_column_codes(codes):
+    codes = np.asarray(codes, dtype=np.uint8) & 0b11
+    padded = np.zeros(-(-len(codes) // 4) * 4, dtype=np.uint8)
+    padded[:len(codes)] = codes
+    quads = padded.reshape(-1, 4)
+    return ((quads[:, 0] << 6) | (quads[:, 1] << 4) | (quads[:, 2] << 2) | quads[:, 3]).astype(np.uint8).tobytes()
+
+# count 2-bit codes packed at block[offset:] → (codes, offset after them)
+def unpack_column_codes(block, count, offset):
+    size = (count + 3) // 4
+    packed = np.frombuffer(block, dtype=np.uint8, count=size, offset=offset)
+    return COLUMN_CODE_TABLE[packed].reshape(-1)[:count], offset + size
+
+# Unsigned integers → (LEB128 bytes, byte offset of every value)
+def encode_varints(values):
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 10):
+        sizes += values >= np.uint64(1 << (7 * k))
+    offsets = np.cumsum(sizes) - sizes
+    out = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    for k in range(int(sizes.max(initial=0))):
+        rows = np.flatnonzero(sizes > k)
+        byte = (values[rows] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        more = (sizes[rows] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[offsets[rows] + k] = byte | more
+    return out.tobytes(), offsets
+
+# LEB128 bytes (whole varints only) → uint64 values, all at once
+def decode_varints(data):
+    data = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(data < 0x80)
+    if len(ends) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    shifts = np.arange(ends[-1] + 1) - np.repeat(starts, ends - starts + 1)
+    parts = (data[:ends[-1] + 1] & 0x7f).astype(np.uint64) << (7 * shifts).astype(np.uint64)
+    return np.add.reduceat(parts, starts)
+
+def zigzag(deltas):
+    deltas = np.asarray(deltas, dtype=np.int64)
+    return ((deltas << 1) ^ (deltas >> 63)).astype(np.uint64)
+
+def unzigzag(values):
+    values = np.asarray(values, dtype=np.uint64)
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+# reference: 0-based positions → reference base codes (UNKNOWN_BASE where masked),
+# used for the SNP REF column of COLUMNS_REFERENCE_SNPS blocks; without it
+# their REF reads as UNKNOWN_BASE.
+class VariantColumns:
+    def __init__(self, block, reference=None):
+        self.block = block
+        self.reference = reference
+        n_snp, n_ins, n_del, flags = COLUMN_HEADER.unpack_from(block, 0)
+        n = n_snp + n_ins + n_del
+        self.sorted = bool(flags & COLUMNS_SORTED)
+        self.reference_snps = bool(flags & COLUMNS_REFERENCE_SNPS)
+        self.types, i = unpack_column_codes(block, n, COLUMN_HEADER.size)
+
+        n_checkpoints = (n + INDEX_STRIDE - 1) // INDEX_STRIDE
+        self.checkpoints = np.frombuffer(block, dtype=INDEX_DTYPE, count=n_checkpoints, offset=i)
+        i += n_checkpoints * INDEX_DTYPE.itemsize
+        stream_length = COLUMN_STREAM_LENGTH.unpack_from(block, i)[0]
+        i += COLUMN_STREAM_LENGTH.size
+        self.position_stream = np.frombuffer(block, dtype=np.uint8, count=stream_length, offset=i)
+        i += stream_length
+
+        if self.reference_snps:
+            self.snp_ref = None
+            self.snp_alt, i = unpack_column_codes(block, n_snp, i)
+        else:
+            self.snp_ref = np.minimum(np.frombuffer(block, dtype=np.uint8, count=n_snp, offset=i), UNKNOWN_BASE)
+            self.snp_alt = np.frombuffer(block, dtype=np.uint8, count=n_snp, offset=i + n_snp) & 0b11
+            i += 2 * n_snp
+        self.ins_length, self.ins_offset, i = self._indel_column(block, i, n_ins)
+        self.del_length, self.del_offset, i = self._indel_column(block, i, n_del)
+        if i > len(block):
+            raise ValueError("Unexpected EOF while reading variant columns.")
+
+        # index of every record within its own type's column
+        self.rank = np.empty(n, dtype=np.int64)
+        for vtype in TYPE_NAMES:
+            rows = np.flatnonzero(self.types == vtype)
+            self.rank[rows] = np.arange(len(rows))
+
+    # LEN column of one indel type → (lengths, payload offsets, offset after the payloads)
+    @staticmethod
+    def _indel_column(block, i, count):
+        if i + COLUMN_STREAM_LENGTH.size > len(block):
+            raise ValueError("Unexpected EOF while reading variant columns.")
+        size = COLUMN_STREAM_LENGTH.unpack_from(block, i)[0]
+        i += COLUMN_STREAM_LENGTH.size
+        length = decode_varints(block[i:i + size]).astype(np.uint32)
+        if len(length) != count:
+            raise ValueError(f"{len(length)} indel lengths in the variant columns, expected {count}.")
+        sizes = (length.astype(np.int64) * 2 + 7) // 8
+        payload = i + size
+        return length, payload + np.cumsum(sizes) - sizes, payload + int(sizes.sum())
+
+    def __len__(self):
+        return len(self.types)
+
+    # POS of records [start, stop), decoding the stream from the checkpoint
+    # before start up to the one after stop
+    def positions(self, start=0, stop=None):
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return np.zeros(0, dtype=np.uint32)
+        first = start // INDEX_STRIDE
+        last = (stop + INDEX_STRIDE - 1) // INDEX_STRIDE
+        begin = int(self.checkpoints['offset'][first])
+        end = int(self.checkpoints['offset'][last]) if last < len(self.checkpoints) else len(self.position_stream)
+        deltas = unzigzag(decode_varints(self.position_stream[begin:end]))
+        deltas[0] = self.checkpoints['pos'][first]
+        pos = np.cumsum(deltas)
+        skip = start - first * INDEX_STRIDE
+        return pos[skip:skip + stop - start].astype(np.uint32)
+
+    # Records [start, stop) as a VariantTable in record order
+    def rows(self, start=0, stop=None):
+        stop = len(self) if stop is None else min(stop, len(self))
+        types = self.types[start:stop]
+        rank = self.rank[start:stop]
+        n = len(types)
+        length = np.ones(n, dtype=np.uint32)
+        ref = np.full(n, UNKNOWN_BASE, dtype=np.uint8)
+        alt = np.full(n, UNKNOWN_BASE, dtype=np.uint8)
+        offset = np.zeros(n, dtype=np.uint64)
+        pos = self.positions(start, stop)
+
+        snp = types == VARIANT_SNP
+        if self.snp_ref is not None:
+            ref[snp] = self.snp_ref[rank[snp]]
+        elif self.reference is not None:
+            ref[snp] = snp_reference(self.reference, pos[snp])
+        alt[snp] = self.snp_alt[rank[snp]]
+        for vtype, lengths, offsets in ((VARIANT_INS, self.ins_length, self.ins_offset),
+                                        (VARIANT_DEL, self.del_length, self.del_offset)):
+            rows = types == vtype
+            length[rows] = lengths[rank[rows]]
+            offset[rows] = offsets[rank[rows]]
+        return VariantTable(pos, types, length, ref, alt, offset, self.block)
+
+    # Merge view: every record as one VariantTable, in record order
+    def merged(self):
+        return self.rows()
+
+    # One type's column as a VariantTable
+    def column(self, vtype):
+        return self.merged().filter(self.types == vtype)
+
+    # Records with start <= POS < end (see query_records); sorted columns only
+    # decode the checkpoint strides that can hold hits
+    def query(self, start, end, overlapping=False):
+        first, stop = 0, len(self)
+        if self.sorted and len(self.checkpoints):
+            if overlapping:
+                k = int(np.searchsorted(self.checkpoints['reach'], start, side='right'))
+            else:
+                k = int(np.searchsorted(self.checkpoints['pos'], start, side='left')) - 1
+            first = max(k, 0) * INDEX_STRIDE
+            stop = int(np.searchsorted(self.checkpoints['pos'], end, side='left')) * INDEX_STRIDE
+        return select_region(self.rows(first, stop), start, end, overlapping)
+
+    # VariantTable → VCOL block. With reference (positions → base codes, as
+    # for the reader) SNP REF is left out; verify_ref first checks that every
+    # known SNP REF matches the reference and raises ValueError otherwise.
+    @staticmethod
+    def encode(table, reference=None, verify_ref=True):
+        pos = table.pos.astype(np.int64)
+        stream, offsets = encode_varints(zigzag(np.diff(pos, prepend=0)))
+        flags = COLUMNS_SORTED if not np.any(pos[1:] < pos[:-1]) else 0
+        if reference is not None:
+            flags |= COLUMNS_REFERENCE_SNPS
+            if verify_ref:
+                check_snp_ref(table, reference)
+        counts = [int(np.count_nonzero(table.vtype == t)) for t in TYPE_NAMES]
+        parts = [COLUMN_HEADER.pack(*counts, flags),
+                 pack_column_codes(table.vtype),
+                 index_entries(table.pos, table.ends(), offsets).tobytes(),
+                 COLUMN_STREAM_LENGTH.pack(len(stream)), stream]
+        for vtype in TYPE_NAMES:
+            rows = np.flatnonzero(table.vtype == vtype)
+            if vtype == VARIANT_SNP and reference is not None:
+                parts.append(pack_column_codes(table.alt[rows]))
+                continue
+            if vtype == VARIANT_SNP:
+                parts.append((table.ref[rows] & 0b11).tobytes())
+                parts.append((table.alt[rows] & 0b11).tobytes())
+                continue
+            length = table.length[rows]
+            lengths, _ = encode_varints(length)
+            parts.append(COLUMN_STREAM_LENGTH.pack(len(lengths)))
+            parts.append(lengths)
+            parts.append(_gather_payloads(table.seq, table.offset[rows], (length.astype(np.int64) * 2 + 7) // 8))
+        return b''.join(parts)
+
+# Reference base codes under SNPs at (1-based) pos
+def snp_reference(reference, pos):
+    return reference(pos.astype(np.int64) - 1)
+
+# ValueError if any SNP's REF differs from the reference at its POS. Masked
+# reference bases are not checked: writers store an N REF as A.
+def check_snp_ref(table, reference):
+    snp = np.flatnonzero((table.vtype == VARIANT_SNP) & (table.ref != UNKNOWN_BASE))
+    expected = snp_reference(reference, table.pos[snp])
+    wrong = np.flatnonzero((table.ref[snp] != expected) & (expected != UNKNOWN_BASE))
+    if len(wrong):
+        k = wrong[0]
+        i = snp[k]
+        raise ValueError(f"{len(wrong)} SNP REF bases differ from the reference, first at POS {table.pos[i]} "
+                         f"({SNP_BASES[table.ref[i]].decode()} in the variants, "
+                         f"{SNP_BASES[expected[k]].decode()} in the reference)")
+
+# Payload bytes [offsets[k], offsets[k] + sizes[k]) for every k, concatenated
+def _gather_payloads(seq, offsets, sizes):
+    data = np.frombuffer(seq, dtype=np.uint8)
+    sizes = sizes.astype(np.int64)
+    total = int(sizes.sum())
+    firsts = np.cumsum(sizes) - sizes
+    index = np.repeat(offsets.astype(np.int64) - firsts, sizes) + np.arange(total)
+    return data[index].tobytes()
+
+
+# --- Cohort genotype matrix (GTMX block) ---
+# One row per variant record, in block order; 2 bits per sample, sample k in
+# byte k // 4, MSB first (the same packing as reference bases). Codes match
+# the META GT byte.
+GT_HOM_REF = 0
+GT_HET = 1
+GT_MISSING = 2
+GT_HOM_ALT = 3
+
+# Copies of the ALT allele (0, 1, 2) → genotype code
+GT_CODE_BY_COPIES = np.array([GT_HOM_REF, GT_HET, GT_HOM_ALT], dtype=np.uint8)
+
+# Packed byte → its 4 genotype codes
+GENOTYPE_DECODE_TABLE = np.array(
+    [[(byte >> shift) & 0b11 for shift in (6, 4, 2, 0)] for byte in range(256)],
+    dtype=np.uint8,
+)
+
+# Genotype codes (rows, samples) → packed GTMX rows
+def pack_genotype_rows(codes):
+    codes = np.asarray(codes, dtype=np.uint8)
+    pad = -codes.shape[1] % 4
+    if pad:
+        codes = np.concatenate([codes, np.zeros((codes.shape[0], pad), dtype=np.uint8)], axis=1)
+    codes = codes.reshape(codes.shape[0], -1, 4)
+    packed = (codes[:, :, 0] << 6) | (codes[:, :, 1] << 4) | (codes[:, :, 2] << 2) | codes[:, :, 3]
+    return packed.tobytes()
+
+# Read-only view over a GTMX block; reading one site is a row slice, reading
+# one sample is a strided gather of one byte column
+class GenotypeMatrix:
+    def __init__(self, block, n_samples):
+        self.n_samples = n_samples
+        self.row_bytes = (n_samples + 3) // 4
+        self.packed = np.frombuffer(block, dtype=np.uint8).reshape(-1, self.row_bytes)
+
+    def __len__(self):
+        return len(self.packed)
+
+    # Codes of every sample for variant rows [start, stop) → (rows, samples)
+    def sites(self, start=0, stop=None):
+        rows = self.packed[start:stop]
+        return GENOTYPE_DECODE_TABLE[rows].reshape(len(rows), -1)[:, :self.n_samples]
+
+    # Codes of every sample at one variant row
+    def site(self, row):
+        return self.sites(row, row + 1)[0]
+
+    # Codes of one sample at every variant row
+    def sample(self, k):
+        if not 0 <= k < self.n_samples:
+            raise IndexError(f"sample {k} out of range for {self.n_samples} samples")
+        return (self.packed[:, k // 4] >> (6 - 2 * (k % 4))) & 0b11
+
+    # Rows where sample k carries the ALT allele
+    def carried_by(self, k):
+        codes = self.sample(k)
+        return np.flatnonzero((codes == GT_HET) | (codes == GT_HOM_ALT))
+
+
+# --- Applying variants ---
+# Bases decoded per reference window while streaming
+RESTORE_WINDOW = 1 << 20
+
+# Walk variants (a VariantTable or record dicts, POS 1-based as in the VCF) in
+# reference order (see VariantTable.starts) and yield the patched sequence
+# chunk by chunk.
+# read_ref(start, end) must return reference bases [start, end) as bytes; it is
+# only ever called with increasing, at most RESTORE_WINDOW-sized ranges.
+# Result is identical to splicing variants into the full sequence in reverse
+# position order: same-position variants apply in record order, and a deletion
+# that runs past the next variant eats into that variant's patched output.
+def iter_patched_sequence(read_ref, ref_length, variants, window=RESTORE_WINDOW):
+    skip = 0    # bases of upcoming output swallowed by earlier deletions
+    cursor = 0  # next reference position not yet emitted
+
+    def emit(data):
+        nonlocal skip
+        if skip >= len(data):
+            skip -= len(data)
+            return b''
+        data = data[skip:]
+        skip = 0
+        return data
+
+    def emit_reference(end):
+        nonlocal cursor, skip
+        # skipped reference bases never need decoding
+        jump = min(skip, end - cursor)
+        cursor += jump
+        skip -= jump
+        for start in range(cursor, end, window):
+            chunk = emit(read_ref(start, min(start + window, end)))
+            if chunk:
+                yield chunk
+        cursor = max(cursor, end)
+
+    table = as_variant_table(variants)
+    starts = table.starts()
+    order = np.argsort(starts, kind='stable')
+    positions = starts[order].tolist()
+    types = table.vtype[order].tolist()
+    lengths = table.length[order].tolist()
+    for pos, group in groupby(range(len(order)), key=positions.__getitem__):
+        pos = min(max(pos, 0), ref_length)
+        yield from emit_reference(pos)
+
+        # Collapse this position's edits into (prefix to emit, bases to drop)
+        prefix = b''
+        drop = 0
+        for k in group:
+            if types[k] == VARIANT_SNP:
+                if prefix:
+                    prefix = table.bases(order[k]) + prefix[1:]
+                else:
+                    prefix = table.bases(order[k])
+                    drop += 1
+            elif types[k] == VARIANT_INS:
+                prefix = table.bases(order[k]) + prefix
+            elif types[k] == VARIANT_DEL:
+                if lengths[k] <= len(prefix):
+                    prefix = prefix[lengths[k]:]
+                else:
+                    drop += lengths[k] - len(prefix)
+                    prefix = b''
+
+        chunk = emit(prefix)
+        if chunk:
+            yield chunk
+        skip += drop
+
+    yield from emit_reference(ref_length)
@@ -0,0 +1,412 @@
+import codecs
+import gzip
+import os
+import re
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Characters read from the VCF per buffer, and records per emitted batch
+READ_BUFFER_SIZE = 1 << 24
+VCF_BATCH_SIZE = 1 << 16
+
+# INFO VT= class of a record ('VT=SNP' / 'VT=INDEL' substring, as before)
+VT_OTHER = 0
+VT_SNP = 1
+VT_INDEL = 2
+
+
+# One batch of VCF data lines, column by column. pos/vt/af/dp are numpy
+# arrays; chrom/ref/alt/gt are lists of str. alt is the raw ALT field
+# ("A,T"), gt one sample's GT string, the first sample by default ('' when
+# FORMAT has no GT, None when the line has no such sample column). AF/DP
+# that are missing or not a single number read as 0. genotypes, when
+# requested, is an int16 array (records, samples, 2) of allele indices with
+# -1 for missing calls. qual is float64 (NaN for '.'), filter the raw FILTER
+# field ("PASS", "q10;s50", "."). sample_text, when requested, holds each
+# line's FORMAT field and its unsplit sample columns (see sample_gt_columns).
+class VcfBatch:
+    def __init__(self, chrom, pos, ref, alt, vt, af, dp, gt, genotypes=None, qual=None, filter=None,
+                 sample_text=None):
+        self.chrom = chrom
+        self.pos = np.asarray(pos, dtype=np.uint32)
+        self.ref = ref
+        self.alt = alt
+        self.vt = np.asarray(vt, dtype=np.uint8)
+        self.af = np.asarray(af, dtype=np.float64)
+        self.dp = np.asarray(dp, dtype=np.int64)
+        self.gt = gt
+        self.genotypes = genotypes
+        self.qual = np.full(len(self.pos), np.nan) if qual is None else np.asarray(qual, dtype=np.float64)
+        self.filter = ['.'] * len(self.pos) if filter is None else filter
+        self.sample_text = sample_text
+
+    def __len__(self):
+        return len(self.pos)
+
+    # Same records with gt replaced by another sample's GT strings
+    def with_gt(self, gt):
+        return VcfBatch(self.chrom, self.pos, self.ref, self.alt, self.vt, self.af, self.dp, gt,
+                        qual=self.qual, filter=self.filter)
+
+    # AF → 0..255 (round half to even, same as round() in the old encoders)
+    def encoded_af(self):
+        return np.rint(np.clip(self.af, 0.0, 1.0) * 255).astype(np.uint8)
+
+    # DP capped to one byte
+    def encoded_dp(self):
+        return np.clip(self.dp, 0, 255).astype(np.uint8)
+
+    @classmethod
+    def concat(cls, batches):
+        batches = list(batches)
+        return cls([c for b in batches for c in b.chrom],
+                   np.concatenate([b.pos for b in batches]) if batches else [],
+                   [r for b in batches for r in b.ref],
+                   [a for b in batches for a in b.alt],
+                   np.concatenate([b.vt for b in batches]) if batches else [],
+                   np.concatenate([b.af for b in batches]) if batches else [],
+                   np.concatenate([b.dp for b in batches]) if batches else [],
+                   [g for b in batches for g in b.gt],
+                   np.concatenate([b.genotypes for b in batches])
+                   if batches and all(b.genotypes is not None for b in batches) else None,
+                   np.concatenate([b.qual for b in batches]) if batches else [],
+                   [f for b in batches for f in b.filter])
+
+
+# INFO value of a key, found without building a dict per record
+INFO_AF = re.compile(r'(?:^|;)AF=([^;]*)')
+INFO_DP = re.compile(r'(?:^|;)DP=([^;]*)')
+
+# INFO value strings → numbers; malformed values (".", "0.1,0.2") → 0.
+# Integers beyond the column type (DP=99999999999999999999) saturate, so they
+# still encode as the largest DP code (255) instead of failing the batch.
+def _info_numbers(values, dtype):
+    try:
+        column = np.array(values, dtype=dtype)
+    except (ValueError, OverflowError):
+        convert = float if dtype == np.float64 else int
+        limits = np.iinfo(dtype) if dtype != np.float64 else None
+        column = np.zeros(len(values), dtype)
+        for k, value in enumerate(values):
+            try:
+                number = convert(value)
+            except (ValueError, OverflowError):
+                continue
+            if limits is not None:
+                number = min(max(number, limits.min), limits.max)
+            column[k] = number
+    if dtype == np.float64:
+        column[np.isnan(column)] = 0.0
+    return column
+
+# QUAL strings → float64, NaN for '.' and malformed values
+def _qual_numbers(values):
+    try:
+        return np.array(['nan' if value == '.' else value for value in values], dtype=np.float64)
+    except ValueError:
+        column = np.full(len(values), np.nan)
+        for k, value in enumerate(values):
+            try:
+                column[k] = float(value)
+            except ValueError:
+                pass
+        return column
+
+# GT of the sample in fields[column] (column 9 is the first sample)
+def _sample_gt(fields, column=9):
+    if len(fields) <= column:
+        return None
+    fmt = fields[8]
+    if fmt == 'GT' or fmt.startswith('GT:'):
+        return fields[column].partition(':')[0]
+    tags = fmt.split(':')
+    if 'GT' not in tags:
+        return ''
+    values = fields[column].split(':')
+    k = tags.index('GT')
+    return values[k] if k < len(values) else ''
+
+
+# GT strings of the given samples (0 = first sample column) for every record
+# of a batch read with sample_text=True → one list per sample, with the same
+# values as the gt column of a batch read for that sample. Each line's sample
+# columns are split once for all of them.
+def sample_gt_columns(batch, samples):
+    columns = [[] for _ in samples]
+    for fmt, text in batch.sample_text:
+        cells = text.split('\t') if text else []
+        tags = fmt.split(':')
+        k = tags.index('GT') if 'GT' in tags else -1
+        for column, sample in zip(columns, samples):
+            if sample >= len(cells):
+                column.append(None)
+            elif k < 0:
+                column.append('')
+            elif k == 0:
+                column.append(cells[sample].partition(':')[0])
+            else:
+                values = cells[sample].split(':')
+                column.append(values[k] if k < len(values) else '')
+    return columns
+
+
+# Sample columns of one line ('0|1\t1/1\t...') → int16 (samples, 2) allele
+# indices, -1 for '.'; haploid calls read as homozygous. Single-digit GT-only
+# rows, the bulk of 1000 Genomes-style files, are decoded without splitting.
+def parse_genotypes(fmt, sample_text):
+    if not sample_text:
+        return np.zeros((0, 2), dtype=np.int16)
+    if fmt == 'GT' and (len(sample_text) + 1) % 4 == 0:
+        cells = np.frombuffer((sample_text + '\t').encode('latin-1'), dtype=np.uint8).reshape(-1, 4)
+        alleles = cells[:, [0, 2]]
+        digits = (alleles >= 48) & (alleles <= 57)
+        if ((cells[:, 3] == 9).all() and np.isin(cells[:, 1], (47, 124)).all()
+                and (digits | (alleles == 46)).all()):
+            return np.where(digits, alleles.astype(np.int16) - 48, -1).astype(np.int16)
+
+    tags = fmt.split(':')
+    samples = sample_text.split('\t')
+    out = np.full((len(samples), 2), -1, dtype=np.int16)
+    if 'GT' not in tags:
+        return out
+    k = tags.index('GT')
+    for i, value in enumerate(samples):
+        values = value.split(':')
+        if k >= len(values):
+            continue
+        calls = values[k].replace('|', '/').split('/')
+        if len(calls) == 1:
+            calls = calls * 2
+        for j, call in enumerate(calls[:2]):
+            if call.isdigit():
+                out[i, j] = int(call)
+    return out
+
+
+# Yield complete lines from a text stream read buffer_size characters at a time
+def _iter_lines(stream, buffer_size=READ_BUFFER_SIZE):
+    carry = ''
+    while True:
+        chunk = stream.read(buffer_size)
+        if not chunk:
+            break
+        lines = (carry + chunk).split('\n')
+        carry = lines.pop()
+        yield from lines
+    if carry:
+        yield carry
+
+# Stream data lines of an open text VCF as VcfBatch objects of up to
+# batch_size records, with the GT column of the sample-th sample. Each line is
+# split once, only up to that sample's column (the rest of a multi-sample
+# line stays one string); AF/DP are kept as text and converted a whole batch
+# at a time. genotypes=True also decodes every sample's GT (cohort mode);
+# sample_text=True keeps the FORMAT field and the unsplit sample columns, so
+# any sample's GT can be picked out later (batch mode).
+def iter_vcf_stream(stream, batch_size=VCF_BATCH_SIZE, buffer_size=READ_BUFFER_SIZE, sample=0,
+                    genotypes=False, sample_text=False):
+    column = 9 + sample
+    split = 9 if genotypes or sample_text else column + 1
+    chrom, pos, ref, alt, vt, af, dp, gt, qual, filters = [], [], [], [], [], [], [], [], [], []
+    geno = [] if genotypes else None
+    texts = [] if sample_text else None
+    af_search = INFO_AF.search
+    dp_search = INFO_DP.search
+    for line in _iter_lines(stream, buffer_size):
+        if not line or line[0] == '#':
+            continue
+        fields = line.rstrip('\r').split('\t', split)
+        if len(fields) < 8:
+            continue
+        info = fields[7]
+        chrom.append(fields[0])
+        pos.append(fields[1])
+        ref.append(fields[3])
+        alt.append(fields[4])
+        qual.append(fields[5])
+        filters.append(fields[6])
+        vt.append(VT_SNP if 'VT=SNP' in info else VT_INDEL if 'VT=INDEL' in info else VT_OTHER)
+        m = af_search(info)
+        af.append(m.group(1) if m else '0')
+        m = dp_search(info)
+        dp.append(m.group(1) if m else '0')
+        if genotypes or sample_text:
+            text = fields[9] if len(fields) > 9 else ''
+            fmt = fields[8] if len(fields) > 8 else ''
+            if genotypes:
+                geno.append(parse_genotypes(fmt, text))
+            if sample_text:
+                texts.append((fmt, text))
+            gt.append(_sample_gt(fields[:9] + [text.partition('\t')[0]]) if text else None)
+        else:
+            gt.append(_sample_gt(fields, column))
+
+        if len(pos) >= batch_size:
+            yield _make_batch(chrom, pos, ref, alt, vt, af, dp, gt, geno, qual, filters, texts)
+            chrom, pos, ref, alt, vt, af, dp, gt, qual, filters = [], [], [], [], [], [], [], [], [], []
+            geno = [] if genotypes else None
+            texts = [] if sample_text else None
+    if pos:
+        yield _make_batch(chrom, pos, ref, alt, vt, af, dp, gt, geno, qual, filters, texts)
+
+def _make_batch(chrom, pos, ref, alt, vt, af, dp, gt, geno=None, qual=None, filters=None, texts=None):
+    return VcfBatch(chrom, np.array(pos, dtype=np.int64), ref, alt, vt,
+                    _info_numbers(af, np.float64), _info_numbers(dp, np.int64), gt,
+                    np.stack(geno) if geno is not None else None,
+                    _qual_numbers(qual) if qual is not None else None, filters, texts)
+
+def iter_vcf_batches(vcf_path, batch_size=VCF_BATCH_SIZE, buffer_size=READ_BUFFER_SIZE, workers=None,
+                     sample=0, genotypes=False, sample_text=False):
+    with open_vcf(vcf_path, workers) as f:
+        yield from iter_vcf_stream(f, batch_size, buffer_size, sample, genotypes, sample_text)
+
+# Sample names from the #CHROM header line ([] for a sites-only VCF)
+def vcf_sample_names(vcf_path):
+    with open_vcf(vcf_path) as f:
+        for line in _iter_lines(f, 1 << 16):
+            if line.startswith('#CHROM'):
+                return line.rstrip('\r').split('\t')[9:]
+            if not line.startswith('#'):
+                break
+    return []
+
+
+# FILTER names the VCF can use: PASS, then every ##FILTER=<ID=...> in header order
+FILTER_HEADER = re.compile(r'^##FILTER=<ID=([^,>]+)')
+
+def vcf_filter_names(vcf_path):
+    names = ['PASS']
+    with open_vcf(vcf_path) as f:
+        for line in _iter_lines(f, 1 << 16):
+            if not line.startswith('##'):
+                break
+            m = FILTER_HEADER.match(line)
+            if m and m.group(1) not in names:
+                names.append(m.group(1))
+    return names
+
+
+# --- Compressed input ---
+# .vcf.gz from bgzip (1000 Genomes, bcftools) is BGZF: a series of
+# independent gzip members of at most 64 KiB each, whose extra field carries
+# the member size ('BC' subfield). Members are inflated on a thread pool
+# (zlib releases the GIL) in order-preserving groups; plain gzip falls back
+# to the gzip module.
+GZIP_MAGIC = b'\x1f\x8b'
+BGZF_BLOCKS_PER_TASK = 64
+
+# Raw BGZF member → its deflate payload (None if the member is not BGZF)
+def _bgzf_member(f):
+    head = f.read(12)
+    if not head:
+        return None, b''
+    if len(head) < 12 or head[:2] != GZIP_MAGIC or not head[3] & 0x04:
+        return None, head
+    xlen = int.from_bytes(head[10:12], 'little')
+    extra = f.read(xlen)
+    i = 0
+    while i + 4 <= len(extra):
+        slen = int.from_bytes(extra[i + 2:i + 4], 'little')
+        if extra[i:i + 2] == b'BC' and slen == 2:
+            bsize = int.from_bytes(extra[i + 4:i + 6], 'little') + 1
+            rest = f.read(bsize - 12 - xlen)
+            if len(rest) != bsize - 12 - xlen:
+                raise ValueError("truncated BGZF block")
+            return rest[:-8], rest[-4:]
+        i += 4 + slen
+    return None, head + extra
+
+def _inflate_members(members):
+    out = []
+    for payload, isize in members:
+        data = zlib.decompress(payload, -15)
+        if len(data) != int.from_bytes(isize, 'little'):
+            raise ValueError("corrupt BGZF block (size mismatch)")
+        out.append(data)
+    return b''.join(out)
+
+def is_bgzf(path):
+    with open(path, 'rb') as f:
+        payload, _ = _bgzf_member(f)
+    return payload is not None
+
+# Yield inflated bytes of a BGZF file, inflating groups of members concurrently
+def iter_bgzf_bytes(path, workers=None):
+    workers = workers or os.cpu_count() or 1
+    with open(path, 'rb') as f, ThreadPoolExecutor(workers) as pool:
+        pending = deque()
+        group = []
+        while True:
+            payload, isize = _bgzf_member(f)
+            if payload is None:
+                if isize:
+                    raise ValueError(f"'{path}' is not a BGZF file")
+                break
+            group.append((payload, isize))
+            if len(group) == BGZF_BLOCKS_PER_TASK:
+                pending.append(pool.submit(_inflate_members, group))
+                group = []
+                if len(pending) > 2 * workers:
+                    yield pending.popleft().result()
+        if group:
+            pending.append(pool.submit(_inflate_members, group))
+        while pending:
+            yield pending.popleft().result()
+
+# Text stream over a BGZF file with the read(size) interface _iter_lines uses
+class BgzfTextReader:
+    def __init__(self, path, workers=None, encoding='utf-8'):
+        self._chunks = iter_bgzf_bytes(path, workers)
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._buffer = ''
+
+    def read(self, size=-1):
+        parts = [self._buffer]
+        have = len(self._buffer)
+        while size < 0 or have < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                parts.append(self._decoder.decode(b'', final=True))
+                break
+            parts.append(self._decoder.decode(chunk))
+            have += len(parts[-1])
+        text = ''.join(parts)
+        if size < 0:
+            size = len(text)
+        data, self._buffer = text[:size], text[size:]
+        return data
+
+    def close(self):
+        self._chunks.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Plain, gzip or BGZF VCF → text stream, chosen by content rather than suffix
+def open_vcf(vcf_path, workers=None):
+    with open(vcf_path, 'rb') as f:
+        magic = f.read(2)
+    if magic != GZIP_MAGIC:
+        return open(vcf_path, 'r')
+    if is_bgzf(vcf_path):
+        return BgzfTextReader(vcf_path, workers)
+    return gzip.open(vcf_path, 'rt')
+
+# Whole VCF as a single VcfBatch, for callers that want to parse once and
+# hand the same columns to several encoders
+def read_vcf(vcf_path):
+    return VcfBatch.concat(iter_vcf_batches(vcf_path))
+
+# A path, a VcfBatch, or an iterable of VcfBatch → iterable of VcfBatch;
+# sample picks the GT column when reading from a path
+def vcf_batches(source, sample=0):
+    if isinstance(source, VcfBatch):
+        return [source]
+    if isinstance(source, (str, bytes)) or hasattr(source, '__fspath__'):
+        return iter_vcf_batches(source, sample=sample)
+    return source
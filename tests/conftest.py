@@ -0,0 +1,57 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+VCF_HEADER = ('##fileformat=VCFv4.1\n'
+              '##FILTER=<ID=q10,Description="Quality below 10">\n'
+              '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\n')
+
+# Random reference of `length` bases (one contig) written as FASTA
+def write_fasta(path, sequence, name='chr11'):
+    with open(path, 'w') as f:
+        f.write(f'>{name}\n')
+        for i in range(0, len(sequence), 60):
+            f.write(sequence[i:i + 60] + '\n')
+
+# rows: (POS, REF, ALT[, QUAL, FILTER, INFO, GT])
+def write_vcf(path, rows, chrom='chr11'):
+    with open(path, 'w') as f:
+        f.write(VCF_HEADER)
+        for row in rows:
+            pos, ref, alt = row[:3]
+            qual, filt, info, gt = (tuple(row[3:]) + ('50', 'PASS', 'AF=0.5;DP=20', '0|1')[len(row) - 3:])
+            f.write(f'{chrom}\t{pos}\t.\t{ref}\t{alt}\t{qual}\t{filt}\t{info}\tGT\t{gt}\n')
+
+# Splice VCF rows into the reference by hand: POS is 1-based and indels carry
+# one anchor base, so every edit starts at 0-based index POS-1
+def apply_vcf(sequence, rows):
+    seq = sequence
+    for row in sorted(rows, key=lambda r: r[0], reverse=True):
+        pos, ref, alt = row[:3]
+        assert seq[pos - 1:pos - 1 + len(ref)] == ref
+        seq = seq[:pos - 1] + alt + seq[pos - 1 + len(ref):]
+    return seq
+
+def read_fasta_sequence(path):
+    with open(path) as f:
+        return ''.join(line.strip() for line in f if not line.startswith('>'))
+
+@pytest.fixture
+def reference():
+    rng = random.Random(7)
+    return ''.join(rng.choice('ACGT') for _ in range(2000))
+
+# Small reference with a SNP, a deletion and an insertion
+@pytest.fixture
+def sample_files(tmp_path, reference):
+    seq = reference[:198] + 'TGC' + reference[201:]
+    rows = [(200, 'G', 'C'), (300, seq[299:302], seq[299]), (400, seq[399], seq[399] + 'TTA')]
+    fasta = str(tmp_path / 'ref.fa')
+    vcf = str(tmp_path / 's.vcf')
+    write_fasta(fasta, seq)
+    write_vcf(vcf, rows)
+    return fasta, vcf, seq, rows
@@ -0,0 +1,66 @@
+import filecmp
+
+import compression
+from compression import generate_ref_hex_with_mask, generate_batch_hex, generate_cohort_hex
+from hex_container import HexContainer
+from variant_records import GT_HOM_REF, GT_HET, GT_MISSING, GT_HOM_ALT
+from conftest import VCF_HEADER
+
+SAMPLE_GTS = [('0|1', '1|1', '0/0'), ('1/1', './.', '0|1'), ('0|0', '1', '1|0')]
+
+def write_cohort(path, rows, columns):
+    with open(path, 'w') as f:
+        f.write(VCF_HEADER.replace('\tS1\n', ''.join(f'\tS{k + 1}' for k in columns) + '\n'))
+        for (pos, ref, alt), gts in zip(rows, SAMPLE_GTS):
+            cells = '\t'.join(f'{gts[k]}:9' for k in columns)
+            f.write(f'chr11\t{pos}\t.\t{ref}\t{alt}\t50\tPASS\tAF=0.5;DP=20\tGT:DP\t{cells}\n')
+
+def test_batch_matches_single_sample_encodes(tmp_path, sample_files, monkeypatch):
+    # spool files roll over to disk after the first few records
+    monkeypatch.setattr(compression, 'SAMPLE_SPILL_BYTES', 8)
+    fasta, _, seq, rows = sample_files
+    cohort = str(tmp_path / 'cohort.vcf')
+    write_cohort(cohort, rows, range(3))
+    serial = generate_batch_hex([cohort], fasta, str(tmp_path / 'serial'))
+    parallel = generate_batch_hex([cohort], fasta, str(tmp_path / 'parallel'), workers=2)
+    assert [r['records'] for r in serial] == [3, 3, 3]
+    assert [r['variants'] for r in serial] == [r['variants'] for r in parallel] == [2, 2, 2]
+
+    for k in range(3):
+        single = str(tmp_path / f'single{k}.vcf')
+        write_cohort(single, rows, [k])
+        generate_ref_hex_with_mask(single, fasta, str(tmp_path / f'single{k}.hex'))
+        for report in (serial[k], parallel[k]):
+            assert filecmp.cmp(report['output'], str(tmp_path / f'single{k}.hex'), shallow=False)
+
+def test_cohort_genotype_matrix(tmp_path, sample_files):
+    fasta, _, seq, _ = sample_files
+    other = lambda ref, k: [b for b in 'ACGT' if b != ref][k]
+    lines = [(200, 'C', ['0|1', '1|1', './.', '0/0', '1']),
+             (300, f'{other(seq[299], 0)},{other(seq[299], 1)}', ['1/2', '0|2', '2', '.|1', '0/0']),
+             # GT-only single-digit calls take the fast path; the second ALT is never carried
+             (400, f'{other(seq[399], 0)},{other(seq[399], 1)}', ['0|1', '0/0', '1/1', '0|0', '1|0'])]
+    cohort = str(tmp_path / 'cohort.vcf')
+    with open(cohort, 'w') as f:
+        f.write(VCF_HEADER.replace('\tS1\n', ''.join(f'\tS{k + 1}' for k in range(5)) + '\n'))
+        for pos, alt, gts in lines:
+            fmt, cells = ('GT', gts) if pos == 400 else ('GT:DP', [f'{gt}:9' for gt in gts])
+            f.write(f'chr11\t{pos}\t.\t{seq[pos - 1]}\t{alt}\t50\tPASS\tAF=0.5;DP=20\t{fmt}\t' + '\t'.join(cells) + '\n')
+    out = str(tmp_path / 'cohort.hex')
+    generate_cohort_hex(cohort, fasta, out)
+
+    ref, het, missing, alt = GT_HOM_REF, GT_HET, GT_MISSING, GT_HOM_ALT
+    expected = [[het, alt, missing, ref, alt],
+                [het, ref, ref, missing, ref],
+                [het, het, alt, missing, ref],
+                [het, ref, alt, ref, het]]
+    with HexContainer(out) as hexfile:
+        assert hexfile.samples == [f'S{k + 1}' for k in range(5)]
+        assert hexfile.variant_table(0).pos.tolist() == [200, 300, 300, 400]
+        matrix = hexfile.genotypes(0)
+        assert matrix.row_bytes == 2 and len(matrix) == 4
+        assert matrix.sites().tolist() == expected
+        assert matrix.site(2).tolist() == expected[2]
+        assert [matrix.sample(k).tolist() for k in range(5)] == [list(col) for col in zip(*expected)]
+        assert matrix.carried_by(2).tolist() == [2, 3]
+        assert hexfile.sample_index('S4') == 3
@@ -0,0 +1,99 @@
+import random
+
+import numpy as np
+import pytest
+
+import variant_records
+from compression import generate_ref_hex_with_mask, generate_batch_hex, generate_cohort_hex
+from hex_container import HexContainer, BLOCK_VARIANTS, BLOCK_VARIANT_COLUMNS, BLOCK_VARIANT_INDEX
+from restore_fasta_from_hex import restore_fasta_streaming
+from variant_records import (VariantColumns, VariantTable, encode_varints, decode_varints, zigzag, unzigzag,
+                             select_region, INDEX_STRIDE)
+from conftest import apply_vcf, read_fasta_sequence
+
+def assert_column_layout(path):
+    with HexContainer(path) as hexfile:
+        assert hexfile.block(BLOCK_VARIANT_COLUMNS, 0) is not None
+        assert hexfile.block(BLOCK_VARIANTS, 0) is None
+        assert hexfile.block(BLOCK_VARIANT_INDEX, 0) is None
+
+@pytest.mark.parametrize('options', [{'columns': True}, {'reference_snps': True},
+                                     {'reference_snps': True, 'workers': 2}])
+def test_columns_round_trip(tmp_path, sample_files, options):
+    fasta, vcf, seq, rows = sample_files
+    out = str(tmp_path / 's.hex')
+    restored = str(tmp_path / 'restored.fa')
+    generate_ref_hex_with_mask(vcf, fasta, out, **options)
+    assert_column_layout(out)
+
+    restore_fasta_streaming(out, restored, window=64)
+    assert read_fasta_sequence(restored) == apply_vcf(seq, rows)
+    with HexContainer(out) as hexfile:
+        assert hexfile.fetch(0, 198, 201) == 'TCC'
+
+def test_columns_match_records(tmp_path, sample_files):
+    fasta, vcf, seq, rows = sample_files
+    generate_ref_hex_with_mask(vcf, fasta, str(tmp_path / 'vars.hex'))
+    generate_batch_hex([vcf], fasta, str(tmp_path / 'batch'), reference_snps=True)
+    generate_cohort_hex(vcf, fasta, str(tmp_path / 'cohort.hex'), columns=True)
+
+    with HexContainer(str(tmp_path / 'vars.hex')) as records:
+        expected = list(records.variant_table(0))
+        for path in (tmp_path / 'batch' / 'S1.hex', tmp_path / 'cohort.hex'):
+            assert_column_layout(str(path))
+            with HexContainer(str(path)) as hexfile:
+                assert list(hexfile.variant_table(0)) == expected
+        with HexContainer(str(tmp_path / 'cohort.hex')) as cohort:
+            assert len(cohort.genotypes(0)) == len(expected)
+
+def test_reference_snps_rejects_wrong_ref(tmp_path, sample_files):
+    fasta, vcf, seq, rows = sample_files
+    with open(vcf) as f:
+        text = f.read()
+    with open(vcf, 'w') as f:
+        f.write(text.replace('\t200\t.\tG\tC', '\t200\t.\tA\tC'))
+    with pytest.raises(ValueError, match='differ from the reference'):
+        generate_ref_hex_with_mask(vcf, fasta, str(tmp_path / 's.hex'), reference_snps=True)
+
+    # verify_ref=False skips the check: REF is read back from the reference
+    outputs = [str(tmp_path / 'unchecked.hex'), str(tmp_path / 'cohort.hex')]
+    generate_ref_hex_with_mask(vcf, fasta, outputs[0], reference_snps=True, verify_ref=False)
+    generate_cohort_hex(vcf, fasta, outputs[1], reference_snps=True, verify_ref=False)
+    report, = generate_batch_hex([vcf], fasta, str(tmp_path / 'batch'), reference_snps=True, verify_ref=False)
+    for path in outputs + [report['output']]:
+        with HexContainer(path) as hexfile:
+            table = hexfile.variant_table(0)
+            assert (table.pos[0], table.ref[0], table.alt[0]) == (200, 2, 1)
+
+def test_varint_checkpoints(monkeypatch):
+    values = [0, 1, 127, 128, 16383, 16384, 2 ** 32, 2 ** 63]
+    data, offsets = encode_varints(values)
+    assert decode_varints(data).tolist() == values
+    assert offsets.tolist() == [0, 1, 2, 3, 5, 7, 10, 15]
+    assert unzigzag(zigzag([0, -1, 1, -70000, 70000])).tolist() == [0, -1, 1, -70000, 70000]
+
+    # gaps of every varint size, deletions reaching across strides, one unsorted table
+    rng = random.Random(20)
+    pos = np.cumsum([rng.choice([0, 1, 100, 20000, 3000000]) for _ in range(200)]) + 1
+    records = [{'type': 'del', 'pos': int(p), 'len': rng.choice([1, 500, 90000])} if k % 5 == 0
+               else {'type': 'snp', 'pos': int(p), 'alt': 'ACGT'[k % 4]} for k, p in enumerate(pos)]
+    for table in (VariantTable.from_records(records), VariantTable.from_records(records[::-1])):
+        columns = VariantColumns(VariantColumns.encode(table))
+        _, offsets = encode_varints(zigzag(np.diff(table.pos.astype(np.int64), prepend=0)))
+        assert columns.checkpoints['pos'].tolist() == table.pos[::INDEX_STRIDE].tolist()
+        assert columns.checkpoints['offset'].tolist() == offsets[::INDEX_STRIDE].tolist()
+        for _ in range(50):
+            start = rng.randrange(len(table))
+            stop = rng.randrange(start, len(table) + 1)
+            assert columns.positions(start, stop).tolist() == table.pos[start:stop].tolist()
+            lo, hi = sorted(rng.sample(range(int(pos[-1]) + 2), 2))
+            for overlapping in (False, True):
+                assert (list(columns.query(lo, hi, overlapping)) ==
+                        list(select_region(table, lo, hi, overlapping)))
+
+    # one stride's positions decode from one checkpoint to the next only
+    decoded = []
+    monkeypatch.setattr(variant_records, 'decode_varints',
+                        lambda data: decoded.append(len(data)) or decode_varints(data))
+    columns.positions(130, 140)
+    assert decoded == [int(columns.checkpoints['offset'][3] - columns.checkpoints['offset'][2])]
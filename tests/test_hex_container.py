@@ -0,0 +1,43 @@
+from functools import partial
+
+import pytest
+
+import hex_container
+from block_codec import compress_block, CompressedBlock
+from conftest import write_fasta, write_vcf
+from compression import generate_ref_hex_with_mask
+from compare_vcf_only import parse_hex_variants
+from hex_container import HexContainer
+
+def test_copies_outlive_close(tmp_path, sample_files):
+    fasta, vcf, seq, rows = sample_files
+    out = str(tmp_path / 's.hex')
+    generate_ref_hex_with_mask(vcf, fasta, out, meta_columns=True)
+
+    table = parse_hex_variants(out)
+    with HexContainer(out) as hexfile:
+        view = hexfile.variant_table(0)
+        meta = hexfile.metadata(0).copy()
+    assert table.record(2) == {'type': 'ins', 'pos': 400, 'alt': 'TTA'}
+    assert [meta.record(i)['GT'] for i in range(3)] == ['0|1'] * 3
+    with pytest.raises(ValueError, match='released'):
+        view.record(2)
+
+def test_query_decodes_only_needed_chunks(tmp_path, reference, monkeypatch):
+    seq = reference * 10
+    rows = [(pos, seq[pos - 1], 'A' if seq[pos - 1] != 'A' else 'C') for pos in range(10, len(seq), 10)]
+    fasta, vcf, out = str(tmp_path / 'ref.fa'), str(tmp_path / 's.vcf'), str(tmp_path / 's.hex')
+    write_fasta(fasta, seq)
+    write_vcf(vcf, rows)
+    monkeypatch.setattr(hex_container, 'compress_block', partial(compress_block, chunk_size=256))
+    generate_ref_hex_with_mask(vcf, fasta, out, codecs={hex_container.BLOCK_VARIANTS: 'zlib'})
+
+    decoded = []
+    chunk = CompressedBlock.chunk
+    monkeypatch.setattr(CompressedBlock, 'chunk', lambda self, k: decoded.append(k) or chunk(self, k))
+    with HexContainer(out) as hexfile:
+        n_chunks = len(hexfile.compressed_block(hex_container.BLOCK_VARIANTS).bounds)
+        assert decoded == []
+        hits = hexfile.query(0, 10000, 10100)
+        assert list(hits.pos) == list(range(10000, 10100, 10))
+        assert 0 < len(set(decoded)) <= 3 < n_chunks
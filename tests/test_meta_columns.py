@@ -0,0 +1,46 @@
+import numpy as np
+
+from compression import generate_ref_hex_with_mask
+from hex_container import HexContainer
+from meta_records import (filter_table, meta_row, encode_meta_columns, MetaColumns, FILTER_OTHER,
+                          MAX_FILTER_NAMES, QUAL_MAX)
+from conftest import write_vcf
+
+def test_undeclared_filter_and_qual_overflow(tmp_path, sample_files):
+    fasta, vcf, seq, rows = sample_files
+    write_vcf(vcf, [rows[0] + ('1e39', 'PASS', 'AF=0.5;DP=20', '0|1'),
+                    rows[1] + ('inf', 'q10;lowDP', 'AF=0.5;DP=20', '1/1'),
+                    rows[2] + ('.', 'strandBias', 'AF=0.5;DP=20', '0/1')])
+    out = str(tmp_path / 's.hex')
+    generate_ref_hex_with_mask(vcf, fasta, out, meta_columns=True)
+
+    with HexContainer(out) as hexfile:
+        meta = hexfile.metadata(0)
+        assert meta.filter_names == ['PASS', 'q10', FILTER_OTHER]
+        assert [meta.record(i)['FILTER'] for i in range(3)] == ['PASS', f'q10;{FILTER_OTHER}', FILTER_OTHER]
+        assert meta.select('FILTER == q10').tolist() == [1]
+        assert meta.qual[0] == QUAL_MAX and meta.qual[1] == QUAL_MAX and np.isnan(meta.qual[2])
+
+def test_filter_table_overflow():
+    names = ['PASS'] + [f'f{k}' for k in range(MAX_FILTER_NAMES - 1)]
+    assert filter_table(names) == names + [FILTER_OTHER]
+    table = filter_table(names + ['one_too_many', 'two_too_many'])
+    assert table == names + [FILTER_OTHER]
+
+    ids = {name: k for k, name in enumerate(table)}
+    rows = [meta_row(0, 0, '0|1', 1, 1.0, 'f3;two_too_many', ids), meta_row(0, 0, '0|1', 1, 1.0, 'PASS', ids)]
+    meta = MetaColumns(encode_meta_columns(b''.join(rows), table))
+    assert [meta.record(i)['FILTER'] for i in range(2)] == [f'f3;{FILTER_OTHER}', 'PASS']
+
+def test_record_matches_columns():
+    ids = {name: k for k, name in enumerate(filter_table(['PASS', 'q10']))}
+    rows = [meta_row(10, 5, '0|1', 1, 30.0, 'PASS', ids), meta_row(200, 4000, '9/12', 2, float('nan'), 'q10;x', ids),
+            meta_row(0, 0, '1', 1, -1.5, '.', ids), meta_row(255, 130, './.', 3, 7.25, 'q10', ids)]
+    meta = MetaColumns(encode_meta_columns(b''.join(rows), filter_table(['PASS', 'q10'])))
+    for i in range(len(meta)):
+        record = meta.record(i)
+        assert record['AF'] == meta.af[i] and record['DP'] == meta.dp[i] and record['ALT'] == meta.alt_index[i]
+        assert record['QUAL'] == (None if np.isnan(meta.qual[i]) else meta.qual[i])
+    assert [meta.record(i)['GT'] for i in range(4)] == ['0|1', '9/12', '1', './.']
+    assert [meta.record(i)['FILTER'] for i in range(4)] == ['PASS', f'q10;{FILTER_OTHER}', '.', 'q10']
+    assert meta.record(-1) == meta.record(3)
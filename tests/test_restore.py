@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+from compression import generate_ref_hex_with_mask, generate_batch_hex
+from hex_container import HexContainer, BLOCK_REFERENCE, REFERENCE_STORE_ENV
+from reference_store import ReferenceStore
+from restore_fasta_from_hex import restore_fasta_streaming
+from conftest import apply_vcf, read_fasta_sequence, write_fasta, write_vcf
+
+def test_snp_replaces_ref_base(tmp_path, sample_files):
+    fasta, vcf, seq, rows = sample_files
+    out = str(tmp_path / 's.hex')
+    generate_ref_hex_with_mask(vcf, fasta, out)
+
+    with HexContainer(out) as hexfile:
+        # SNP at POS 200 replaces the G at index 199
+        assert hexfile.fetch(0, 198, 201) == 'TCC'
+        assert hexfile.fetch(0, 198, 201, apply_variants=False) == 'TGC'
+        assert hexfile.fetch(0, 199, 200) == 'C'
+
+def test_restore_matches_vcf(tmp_path, sample_files):
+    fasta, vcf, seq, rows = sample_files
+    out = str(tmp_path / 's.hex')
+    restored = str(tmp_path / 'restored.fa')
+    generate_ref_hex_with_mask(vcf, fasta, out)
+    restore_fasta_streaming(out, restored, window=64)
+
+    assert read_fasta_sequence(restored) == apply_vcf(seq, rows)
+
+def test_store_backed_restore(tmp_path, sample_files, monkeypatch):
+    fasta, vcf, seq, rows = sample_files
+    store = str(tmp_path / 'store')
+    out = str(tmp_path / 's.hex')
+    restored = str(tmp_path / 'restored.fa')
+    generate_ref_hex_with_mask(vcf, fasta, out, reference_store=store)
+    with HexContainer(out, attach_reference=False) as hexfile:
+        assert hexfile.block(BLOCK_REFERENCE, 0) is None
+
+    restore_fasta_streaming(out, restored, window=64, reference_store=store)
+    assert read_fasta_sequence(restored) == apply_vcf(seq, rows)
+
+    # writers and readers share one default store
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv(REFERENCE_STORE_ENV, raising=False)
+    with pytest.raises(FileNotFoundError):
+        restore_fasta_streaming(out, restored)
+    monkeypatch.setenv(REFERENCE_STORE_ENV, store)
+    assert ReferenceStore().root == store
+    restore_fasta_streaming(out, restored)
+    assert read_fasta_sequence(restored) == apply_vcf(seq, rows)
+
+def test_fetch_matches_vcf(tmp_path, sample_files):
+    fasta, vcf, seq, rows = sample_files
+    out = str(tmp_path / 's.hex')
+    generate_ref_hex_with_mask(vcf, fasta, out)
+
+    with HexContainer(out) as hexfile:
+        assert hexfile.fetch(0, 0, len(seq)) == apply_vcf(seq, rows)
+        # window starting inside the deletion trims its remaining bases
+        assert hexfile.fetch(0, 301, 310) == seq[302:310]
+
+def test_long_indels_round_trip(tmp_path):
+    rng = random.Random(3)
+    seq = ''.join(rng.choice('ACGT') for _ in range(72000))
+    insertion = ''.join(rng.choice('ACGT') for _ in range(70000))
+    rows = [(100, seq[99], 'G' if seq[99] != 'G' else 'T'), (500, seq[499:499 + 70001], seq[499]),
+            (71000, seq[70999], seq[70999] + insertion)]
+    fasta = str(tmp_path / 'ref.fa')
+    vcf = str(tmp_path / 's.vcf')
+    write_fasta(fasta, seq)
+    write_vcf(vcf, rows)
+    expected = apply_vcf(seq, rows)
+
+    for name, options in (('s', {}), ('c', {'columns': True})):
+        out = str(tmp_path / f'{name}.hex')
+        restored = str(tmp_path / f'{name}.fa')
+        generate_ref_hex_with_mask(vcf, fasta, out, **options)
+        with HexContainer(out) as hexfile:
+            assert hexfile.variant_table(0).length.tolist() == [1, 70000, 70000]
+        restore_fasta_streaming(out, restored)
+        assert read_fasta_sequence(restored) == expected
+
+    report, = generate_batch_hex([vcf], fasta, str(tmp_path / 'batch'))
+    restore_fasta_streaming(report['output'], str(tmp_path / 'batch.fa'))
+    assert read_fasta_sequence(str(tmp_path / 'batch.fa')) == expected
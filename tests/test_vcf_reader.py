@@ -0,0 +1,79 @@
+import filecmp
+import gzip
+import random
+import struct
+import zlib
+
+import numpy as np
+
+import vcf_reader
+from compression import generate_ref_hex_with_mask
+from hex_container import HexContainer
+from meta_records import FIELD_DP
+from vcf_reader import read_vcf, iter_vcf_batches, is_bgzf, VcfBatch
+from conftest import write_fasta, write_vcf
+
+def test_huge_dp_saturates(tmp_path, sample_files):
+    fasta, vcf, seq, rows = sample_files
+    write_vcf(vcf, [rows[0] + ('50', 'PASS', 'AF=0.5;DP=99999999999999999999', '0|1'),
+                    rows[1] + ('50', 'PASS', 'AF=0.5;DP=-99999999999999999999', '0|1'),
+                    rows[2] + ('50', 'PASS', 'AF=0.5;DP=17', '0|1')])
+
+    batch = read_vcf(vcf)
+    assert batch.dp.tolist() == [np.iinfo(np.int64).max, np.iinfo(np.int64).min, 17]
+
+    out = str(tmp_path / 's.hex')
+    generate_ref_hex_with_mask(vcf, fasta, out)
+    with HexContainer(out) as hexfile:
+        assert hexfile.metadata(0).dp.tolist() == [255, 0, 17]
+
+    generate_ref_hex_with_mask(vcf, fasta, out, meta_columns=True)
+    with HexContainer(out) as hexfile:
+        assert hexfile.metadata(0).column(FIELD_DP).tolist() == [255, 0, 17]
+
+# bgzip-style file: text in members of block_size bytes, then the empty EOF member
+def write_bgzf(path, data, block_size):
+    with open(path, 'wb') as f:
+        for start in list(range(0, len(data), block_size)) + [len(data)]:
+            chunk = data[start:start + block_size]
+            deflate = zlib.compressobj(6, zlib.DEFLATED, -15)
+            payload = deflate.compress(chunk) + deflate.flush()
+            f.write(b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff' + struct.pack('<HBBHH', 6, 66, 67, 2, len(payload) + 25))
+            f.write(payload + struct.pack('<II', zlib.crc32(chunk), len(chunk)))
+
+def batch_columns(batches):
+    batch = VcfBatch.concat(batches)
+    return (batch.chrom, batch.pos.tolist(), batch.ref, batch.alt, batch.vt.tolist(), batch.af.tolist(),
+            batch.dp.tolist(), batch.gt, batch.qual.tolist(), batch.filter)
+
+def test_compressed_inputs_match_plain_text(tmp_path, reference, monkeypatch):
+    rng = random.Random(11)
+    rows = [(pos, reference[pos - 1], 'ACGT'[k % 4], str(k), 'PASS' if k % 3 else 'q10',
+             f'AF=0.{k % 10};DP={k};VT=SNP', '0|1' if k % 2 else '1/1')
+            for k, pos in enumerate(sorted(rng.sample(range(1, len(reference)), 500)))]
+    vcf = str(tmp_path / 's.vcf')
+    write_vcf(vcf, rows)
+    with open(vcf, 'rb') as f:
+        data = f.read()
+    plain = batch_columns(iter_vcf_batches(vcf))
+
+    gz = str(tmp_path / 's.vcf.gz')
+    with gzip.open(gz, 'wb') as f:
+        f.write(data)
+    assert not is_bgzf(gz)
+    assert batch_columns(iter_vcf_batches(gz)) == plain
+
+    # many small members, inflated two per task on three threads, with
+    # records and read buffers split across member boundaries
+    monkeypatch.setattr(vcf_reader, 'BGZF_BLOCKS_PER_TASK', 2)
+    bgz = str(tmp_path / 's.vcf.bgz')
+    write_bgzf(bgz, data, 333)
+    assert is_bgzf(bgz)
+    assert batch_columns(iter_vcf_batches(bgz, batch_size=37, buffer_size=1000, workers=3)) == plain
+
+    fasta = str(tmp_path / 'ref.fa')
+    write_fasta(fasta, reference)
+    for path, name in ((vcf, 'plain'), (gz, 'gz'), (bgz, 'bgz')):
+        generate_ref_hex_with_mask(path, fasta, str(tmp_path / f'{name}.hex'))
+    assert filecmp.cmp(str(tmp_path / 'plain.hex'), str(tmp_path / 'gz.hex'), shallow=False)
+    assert filecmp.cmp(str(tmp_path / 'plain.hex'), str(tmp_path / 'bgz.hex'), shallow=False)